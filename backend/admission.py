@@ -0,0 +1,188 @@
+"""
+Priority-aware admission control for API requests
+
+Every request is assigned a class by endpoint. Gameplay writes (battle,
+become_owner), read-only polling (get_locations, get_teams) and launch-time
+bootstrap each get their own concurrency limit and queue timeout, and
+everything else shares a default class, so a burst of polling cannot take
+the worker threads and Supabase connections that gameplay needs. A request
+that cannot get a slot within its class's queue timeout is shed: polling is
+answered from the last successful response for the same URL and negotiated
+format while it is fresh enough, otherwise with 503 and Retry-After.
+Admission and shedding counters are reported by stats().
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from flask import request, jsonify, g, Response
+
+# Constants
+GAMEPLAY_ENDPOINTS = {'interactions.battle', 'interactions.become_owner'}
+POLLING_ENDPOINTS = {'locations.get_locations', 'teams.get_teams'}
+BOOTSTRAP_ENDPOINTS = {'bootstrap.bootstrap'}
+EXEMPT_ENDPOINTS = {'health_check', 'readiness_check', 'static'}
+
+STALE_MAX_AGE = 30  # Seconds a cached polling response may be served while shedding
+STALE_MAX_ENTRIES = 64  # Bound on cached polling responses, one per URL
+SERVED_STALE_HEADER = 'X-Served-Stale'
+
+def _env_number(name, default, cast):
+    try:
+        return cast(os.getenv(name, default))
+    except ValueError:
+        return default
+
+class AdmissionClass:
+    """Concurrency limit with a bounded wait for a slot"""
+
+    def __init__(self, name, limit, queue_timeout, retry_after):
+        self.name = name
+        self.limit = limit
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._slots = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+        self._stats = {'admitted': 0, 'waited': 0, 'shed': 0, 'served_stale': 0, 'in_flight': 0, 'max_wait_ms': 0.0}
+
+    def acquire(self):
+        """Take a slot, waiting up to queue_timeout; False means the request should be shed"""
+        if self._slots.acquire(blocking=False):
+            waited = 0.0
+        else:
+            started = time.perf_counter()
+            if not self._slots.acquire(timeout=self.queue_timeout):
+                return False
+            waited = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._stats['admitted'] += 1
+            self._stats['in_flight'] += 1
+            if waited:
+                self._stats['waited'] += 1
+                self._stats['max_wait_ms'] = max(self._stats['max_wait_ms'], round(waited, 2))
+        return True
+
+    def release(self):
+        with self._lock:
+            self._stats['in_flight'] -= 1
+        self._slots.release()
+
+    def count(self, counter):
+        with self._lock:
+            self._stats[counter] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, limit=self.limit, queue_timeout=self.queue_timeout)
+
+classes = {
+    'gameplay': AdmissionClass(
+        'gameplay',
+        limit=_env_number('ADMISSION_GAMEPLAY_LIMIT', 16, int),
+        queue_timeout=_env_number('ADMISSION_GAMEPLAY_TIMEOUT', 2.0, float),
+        retry_after=1
+    ),
+    'polling': AdmissionClass(
+        'polling',
+        limit=_env_number('ADMISSION_POLLING_LIMIT', 4, int),
+        queue_timeout=_env_number('ADMISSION_POLLING_TIMEOUT', 0.05, float),
+        retry_after=5
+    ),
+    'bootstrap': AdmissionClass(
+        'bootstrap',
+        limit=_env_number('ADMISSION_BOOTSTRAP_LIMIT', 16, int),
+        queue_timeout=_env_number('ADMISSION_BOOTSTRAP_TIMEOUT', 1.0, float),
+        retry_after=2
+    ),
+    'default': AdmissionClass(
+        'default',
+        limit=_env_number('ADMISSION_DEFAULT_LIMIT', 8, int),
+        queue_timeout=_env_number('ADMISSION_DEFAULT_TIMEOUT', 1.0, float),
+        retry_after=2
+    )
+}
+
+# Last successful polling response per URL and format: (full path, best Accept mimetype) -> (stored_at, body, mimetype)
+_last_responses = OrderedDict()
+_last_responses_lock = threading.Lock()
+
+def classify(endpoint):
+    """Admission class name for a Flask endpoint, or None if it is never limited"""
+    if endpoint is None or endpoint in EXEMPT_ENDPOINTS:
+        return None
+    if endpoint in GAMEPLAY_ENDPOINTS:
+        return 'gameplay'
+    if endpoint in POLLING_ENDPOINTS:
+        return 'polling'
+    if endpoint in BOOTSTRAP_ENDPOINTS:
+        return 'bootstrap'
+    return 'default'
+
+def _response_key():
+    """Cache key of a polling response: the URL and the format negotiated from the Accept header"""
+    return request.full_path, request.accept_mimetypes.best
+
+def _stale_response():
+    with _last_responses_lock:
+        entry = _last_responses.get(_response_key())
+    if entry is None or time.monotonic() - entry[0] > STALE_MAX_AGE:
+        return None
+    response = Response(entry[1], status=200, mimetype=entry[2])
+    response.headers[SERVED_STALE_HEADER] = 'true'
+    return response
+
+def _remember_response(response):
+    if response.status_code != 200 or response.is_streamed or request.method != 'GET':
+        return
+    key = _response_key()
+    with _last_responses_lock:
+        _last_responses[key] = (time.monotonic(), response.get_data(), response.mimetype)
+        _last_responses.move_to_end(key)
+        while len(_last_responses) > STALE_MAX_ENTRIES:
+            _last_responses.popitem(last=False)
+
+def _shed(admission_class):
+    if admission_class.name == 'polling':
+        stale = _stale_response()
+        if stale is not None:
+            admission_class.count('served_stale')
+            return stale
+
+    admission_class.count('shed')
+    response = jsonify({'error': 'Server is overloaded, try again shortly'})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(admission_class.retry_after)
+    return response
+
+def admit():
+    """before_request hook: take a slot for the request's class or shed it"""
+    name = classify(request.endpoint)
+    if name is None:
+        return None
+
+    admission_class = classes[name]
+    if not admission_class.acquire():
+        return _shed(admission_class)
+    g.admission_class = admission_class
+    return None
+
+def remember(response):
+    """after_request hook: keep the last good polling response for serving while shedding"""
+    if getattr(g, 'admission_class', None) is classes['polling']:
+        _remember_response(response)
+    return response
+
+def release(exc=None):
+    """teardown_request hook: give the slot back"""
+    admission_class = g.pop('admission_class', None)
+    if admission_class is not None:
+        admission_class.release()
+
+def init_app(app):
+    app.before_request(admit)
+    app.after_request(remember)
+    app.teardown_request(release)
+
+def stats():
+    """Per-class admission counters for health reporting"""
+    return {name: admission_class.stats() for name, admission_class in classes.items()}
@@ -1,10 +1,23 @@
+import time
+
+# Measure import/startup time from the very first line
+IMPORT_STARTED = time.perf_counter()
+
 import os
 import threading
-import time
 from datetime import datetime
 from flask import Flask, jsonify, request
-from dotenv import load_dotenv
-from database import get_supabase_client
+from database import get_supabase_client, is_configured
+import admission
+import battle_queue
+import idempotency
+import invalidation
+import points_history
+import row_cache
+import scoring
+import sharding
+import snapshot
+import stats_buffer
 
 # Import blueprints
 from routes.auth import auth_bp
@@ -12,90 +25,103 @@ from routes.profile import profile_bp
 from routes.locations import locations_bp
 from routes.interactions import interactions_bp
 from routes.teams import teams_bp
-
-# Load environment variables
-load_dotenv()
+from routes.shards import shards_bp
+from routes.bootstrap import bootstrap_bp
+from routes.profile import get_default_pfp
 
 app = Flask(__name__)
 
-# Get Supabase client from shared database module
-supabase = get_supabase_client()
+# Startup timing and readiness, reported by /health and /ready
+startup_state = {
+    'import_seconds': None,
+    'warm_up_seconds': None,
+    'warm_up_error': None,
+    'warmed_up': False
+}
+_warm_up_lock = threading.Lock()
+
+def reconcile_point_rates():
+    """Background task to bring team accrual rates in line with current location ownership"""
+    if not is_configured():
+        print(f"[{datetime.now()}] Warning: Supabase not configured, skipping point rate reconciliation")
+        return
+    
+    try:
+        rates = scoring.reconcile_rates()
+        print(f"[{datetime.now()}] Point accrual rates reconciled for {len(rates)} owning teams")
+    except Exception as e:
+        print(f"[{datetime.now()}] Error reconciling point accrual rates: {str(e)}")
 
-def award_location_points():
-    """Background task to award points to teams based on location ownership"""
-    while True:
+def warm_up():
+    """Create the Supabase client, load static assets and the hot world state before serving, returns success"""
+    with _warm_up_lock:
+        if startup_state['warmed_up']:
+            return True
+        
+        started = time.perf_counter()
+        supabase = get_supabase_client()
+        get_default_pfp()
+        
         try:
             if not supabase:
-                print(f"[{datetime.now()}] Warning: Supabase not configured, skipping point award")
-                time.sleep(600)  # Wait 10 minutes
-                continue
-            
-            print(f"[{datetime.now()}] Starting location points award cycle...")
-            
-            # Get all locations with owner teams
-            locations_response = supabase.table('locations').select(
-                'owner_team, owner_count'
-            ).not_.is_('owner_team', 'null').execute()
-            
-            if not locations_response.data:
-                print(f"[{datetime.now()}] No locations with owners found")
-                time.sleep(600)  # Wait 10 minutes
-                continue
-            
-            # Calculate points to award to each team
-            team_points = {}
-            for location in locations_response.data:
-                owner_team = location.get('owner_team')
-                owner_count = location.get('owner_count', 0)
-                
-                if owner_team and owner_count > 0:
-                    if owner_team not in team_points:
-                        team_points[owner_team] = 0
-                    team_points[owner_team] += owner_count
-            
-            # Award points to each team
-            points_awarded = 0
-            for team_id, points in team_points.items():
-                try:
-                    # Get current team points
-                    current_response = supabase.table('teams').select('points').eq('id', team_id).execute()
-                    
-                    if current_response.data:
-                        current_points = current_response.data[0].get('points', 0)
-                        new_points = current_points + points
-                        
-                        # Update team points
-                        update_response = supabase.table('teams').update({
-                            'points': new_points
-                        }).eq('id', team_id).execute()
-                        
-                        if update_response.data:
-                            points_awarded += points
-                            print(f"[{datetime.now()}] Awarded {points} points to team {team_id} (total: {new_points})")
-                        else:
-                            print(f"[{datetime.now()}] Failed to update points for team {team_id}")
-                    else:
-                        print(f"[{datetime.now()}] Team {team_id} not found in database")
-                        
-                except Exception as e:
-                    print(f"[{datetime.now()}] Error updating points for team {team_id}: {str(e)}")
-            
-            print(f"[{datetime.now()}] Points award cycle completed. Total points awarded: {points_awarded}")
+                raise RuntimeError('Supabase not configured')
             
+            # Load locations and teams into the in-memory world state and prime the team row cache
+            if not snapshot.reconcile():
+                raise RuntimeError('Could not load locations and teams')
+            for team_id, team in (snapshot.get_teams() or {}).items():
+                row_cache.teams.put(team_id, team)
         except Exception as e:
-            print(f"[{datetime.now()}] Error in location points award task: {str(e)}")
+            startup_state['warm_up_error'] = str(e)
+            print(f"[{datetime.now()}] Warm-up failed: {str(e)}")
+            return False
         
-        # Wait 10 minutes (600 seconds) before next cycle
-        time.sleep(600)
+        startup_state['warm_up_seconds'] = round(time.perf_counter() - started, 4)
+        startup_state['warm_up_error'] = None
+        startup_state['warmed_up'] = True
+        print(f"[{datetime.now()}] Warm-up completed in {startup_state['warm_up_seconds']}s")
+        return True
+
+def warm_up_enabled():
+    """Warm-up before accepting requests at startup is opt-in via WARM_UP=1, otherwise it runs on the first /ready"""
+    return os.getenv('WARM_UP', '').lower() in ('1', 'true', 'yes')
 
 def start_background_tasks():
     """Start background tasks in separate threads"""
     print(f"[{datetime.now()}] Starting background tasks...")
     
-    # Start location points award task
-    points_thread = threading.Thread(target=award_location_points, daemon=True)
-    points_thread.start()
-    print(f"[{datetime.now()}] Location points award task started")
+    # Receive change events from other workers
+    row_cache.start()
+    invalidation.start()
+    print(f"[{datetime.now()}] Invalidation bus listener started")
+    
+    # Load the local game state snapshot, then reconcile and persist it in the background
+    snapshot.start()
+    print(f"[{datetime.now()}] Game state snapshot task started")
+    
+    # Keep the other shards' ownership summaries fresh for get_teams
+    sharding.start()
+    print(f"[{datetime.now()}] Shard summary refresher started")
+    
+    # Points accrue lazily from ownership, so only make sure every team's accrual rate matches its locations
+    reconcile_thread = threading.Thread(target=reconcile_point_rates, daemon=True)
+    reconcile_thread.start()
+    print(f"[{datetime.now()}] Point accrual rate reconciliation started")
+    
+    # Sample team scores into the points history
+    points_history.start()
+    print(f"[{datetime.now()}] Points history sampler started")
+    
+    # Start write-behind flusher for player stat updates
+    stats_buffer.start()
+    print(f"[{datetime.now()}] Stat update flusher started")
+    
+    # Start per-location battle ticks
+    battle_queue.start()
+    print(f"[{datetime.now()}] Battle tick loop started")
+
+# Limit concurrent requests per priority class, shedding polling first under overload
+admission.init_app(app)
 
 # Register blueprints with /api prefix
 app.register_blueprint(auth_bp, url_prefix='/api/auth')
@@ -103,6 +129,8 @@ app.register_blueprint(profile_bp, url_prefix='/api/profile')
 app.register_blueprint(locations_bp, url_prefix='/api/locations')
 app.register_blueprint(interactions_bp, url_prefix='/api/interactions')
 app.register_blueprint(teams_bp, url_prefix='/api/teams')
+app.register_blueprint(shards_bp, url_prefix='/api/shards')
+app.register_blueprint(bootstrap_bp, url_prefix='/api/bootstrap')
 
 @app.route('/')
 def hello_world():
@@ -114,27 +142,54 @@ def hello_world():
             'profile': '/api/profile',
             'locations': '/api/locations',
             'interactions': '/api/interactions',
-            'teams': '/api/teams'
+            'teams': '/api/teams',
+            'shards': '/api/shards',
+            'bootstrap': '/api/bootstrap'
         }
     })
 
 @app.route('/health')
 def health_check():
     """Health check endpoint"""
-    supabase_status = "connected" if supabase else "not configured"
+    supabase_status = "connected" if is_configured() else "not configured"
     return jsonify({
         'status': 'healthy',
         'service': 'cmugo-backend',
         'supabase': supabase_status,
         'api_version': '1.0.0',
+        'startup': startup_state,
+        'row_cache': row_cache.stats(),
+        'idempotency': idempotency.store.stats(),
+        'admission': admission.stats(),
         'background_tasks': {
-            'location_points_award': 'running'
+            'point_accrual': 'lazy',
+            'points_history': points_history.status(),
+            'stat_update_flusher': 'running',
+            'battle_ticks': battle_queue.status(),
+            'game_state_snapshot': snapshot.status(),
+            'invalidation_bus': invalidation.get_bus().stats(),
+            'shard_summary_ages': sharding.summary_status()
         }
     })
 
+@app.route('/ready')
+def readiness_check():
+    """Readiness endpoint, reports ready only once the warm-up has loaded the hot data"""
+    if not startup_state['warmed_up'] and not warm_up():
+        return jsonify({
+            'status': 'not ready',
+            'startup': startup_state
+        }), 503
+    
+    return jsonify({
+        'status': 'ready',
+        'startup': startup_state
+    })
+
 @app.route('/test-supabase')
 def test_supabase():
     """Test Supabase connection"""
+    supabase = get_supabase_client()
     if not supabase:
         return jsonify({'error': 'Supabase not configured'}), 500
     
@@ -152,11 +207,19 @@ def test_supabase():
             'error': str(e)
         })
 
+startup_state['import_seconds'] = round(time.perf_counter() - IMPORT_STARTED, 4)
+
 if __name__ == '__main__':
+    print(f"[{datetime.now()}] App imported in {startup_state['import_seconds']}s")
+    
+    # Pre-populate hot data before accepting requests
+    if warm_up_enabled():
+        warm_up()
+    
     # Start background tasks
     start_background_tasks()
     
     # Start Flask app
     print(f"[{datetime.now()}] Starting Flask server...")
-    app.run(debug=True, host='127.0.0.1', port=5001)
+    app.run(debug=True, host='127.0.0.1', port=int(os.getenv('PORT', 5001)))
 
@@ -0,0 +1,267 @@
+"""
+Tick-based per-location battle scheduler
+
+battle and become_owner requests are queued per location and resolved
+together every TICK_INTERVAL seconds: each tick does one read of a
+location's state, applies all queued outcomes in arrival order and makes
+at most one consolidated write (the apply_location_tick SQL function, which
+updates the location, its owner rows and the affected teams' accrual rates
+in one transaction). The write is a compare-and-set on the location's
+ownership: if another worker changed it since it was read, nothing is
+written and the tick is redone from a fresh read. Stat deltas produced by a
+tick are only queued once its writes have succeeded. Each waiting request gets its result
+when its tick completes; a request that gives up waiting cancels its job so
+a later tick cannot apply it behind the client's back.
+"""
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import datetime
+from database import get_supabase_client
+import invalidation
+import row_cache
+import scoring
+import snapshot
+import stats_buffer
+
+# Constants
+TICK_INTERVAL = 0.1  # Seconds between ticks
+RESULT_TIMEOUT = 10  # Seconds a request waits for its tick before giving up
+RESOLVE_WORKERS = 8  # Locations resolved in parallel within one tick
+MAX_TICK_ATTEMPTS = 3  # Reads of a location per tick when another worker keeps changing it first
+OWNERSHIP_FIELDS = ('owner_team', 'owner_count', 'strongest_owner_id')
+
+_lock = threading.Lock()
+_queues = {}  # location_id -> jobs waiting for the next tick
+_ticker = None
+_stats = {'ticks': 0, 'jobs': 0, 'location_lookups': 0, 'location_writes': 0, 'conflicts': 0}
+
+def submit(location_id, kind, user_id, user, data):
+    """Queue a 'battle' or 'become_owner' job and wait for its tick, returns (body, status)"""
+    _ensure_ticker()
+
+    job = {
+        'kind': kind,
+        'user_id': user_id,
+        'user': user,
+        'data': data,
+        'future': Future()
+    }
+    with _lock:
+        _queues.setdefault(location_id, []).append(job)
+
+    try:
+        return job['future'].result(timeout=RESULT_TIMEOUT)
+    except FutureTimeoutError:
+        if job['future'].cancel():
+            # Never applied, so a retry is safe
+            return {'error': 'Request timed out before it was resolved, it was not applied'}, 503
+        # Its tick has already started, wait for the outcome rather than report a false failure
+        return job['future'].result()
+
+def _apply_battle(state, job, deltas):
+    """Resolve one battle against the current location state"""
+    user_id = job['user_id']
+    # Re-apply pending deltas here so battles earlier in the same tick are seen
+    user = deltas.apply_pending(user_id, job['user'])
+    user_team = user.get('team')
+    user_strength = user.get('strength') or 0
+
+    # Check if user's team already owns the location
+    if state.get('owner_team') == user_team:
+        return {'error': 'Your team already owns this location'}, 400
+
+    # Determine if user wins
+    wins = job['data'].get('result') == 'win'
+
+    # Calculate strength change (-1 to 3 inclusive, clamped between 0 and 100)
+    strength_change = random.randint(-1, 3)
+    new_strength = max(0, min(100, user_strength + strength_change))
+
+    last_battle = datetime.utcnow().isoformat()
+    if wins:
+        deltas.record(user_id, wins=1, strength=new_strength - user_strength, last_battle=last_battle)
+
+        # Increment losses count for the defeated strongest owner
+        if state.get('strongest_owner_id'):
+            deltas.record(state['strongest_owner_id'], losses=1)
+        return {'message': 'win'}, 200
+
+    deltas.record(user_id, losses=1, strength=new_strength - user_strength, last_battle=last_battle)
+    return {'message': 'lose'}, 200
+
+class _OwnerChanges:
+    """Owner changes made during a tick, written by the tick's apply_location_tick call"""
+
+    def __init__(self):
+        self.cleared = False
+        self.added = set()
+
+    def add(self, user_id):
+        self.added.add(user_id)
+
+    def clear(self):
+        """Remove every owner (the location changed team)"""
+        self.cleared = True
+        self.added = set()
+
+    def changed(self):
+        return self.cleared or bool(self.added)
+
+def _apply_become_owner(state, job, owners, deltas):
+    """Add the user to their team's owners at the location, or take it over for their team"""
+    if job['data'].get('result') == 'lose':
+        return {'message': 'success'}, 200
+
+    user_id = job['user_id']
+    user_team = job['user'].get('team')
+    previous_strongest_owner_id = state.get('strongest_owner_id')
+
+    # owner_count and locations_owned follow the owner rows the tick's write actually removes and inserts
+    if state.get('owner_team') != user_team:
+        owners.clear()
+        deltas.record(user_id, locations_conquered=1)
+    owners.add(user_id)
+
+    if previous_strongest_owner_id != user_id:
+        if previous_strongest_owner_id:
+            deltas.record(previous_strongest_owner_id, locations_defending=-1)
+        deltas.record(user_id, locations_defending=1)
+
+    state['strongest_owner_id'] = user_id
+    state['owner_team'] = user_team
+    return {'message': 'success'}, 200
+
+def _run_tick(supabase, location_id, location, jobs):
+    """Apply the jobs to a location row and write the outcome, returns the results or None if the row was stale"""
+    original = {field: location.get(field) for field in OWNERSHIP_FIELDS}
+    state = dict(original)
+    owners = _OwnerChanges()
+    deltas = stats_buffer.Batch()
+    results = []
+    for job in jobs:
+        if job['kind'] == 'battle':
+            results.append(_apply_battle(state, job, deltas))
+        else:
+            results.append(_apply_become_owner(state, job, owners, deltas))
+
+    update_data = {field: value for field, value in state.items() if original.get(field) != value}
+    if update_data or owners.changed():
+        # Location row, owner rows and team accrual rates change together in one transaction,
+        # which locks the location and only writes if its ownership still matches the row read here.
+        # It sets owner_count from the owner rows and moves the accrual rates by the change in that count
+        response = supabase.rpc('apply_location_tick', {
+            'p_location_id': location_id,
+            'p_expected': original,
+            'p_fields': update_data,
+            'p_clear_owners': owners.cleared,
+            'p_add_owners': sorted(owners.added)
+        }).execute()
+        written = response.data or {}
+        if written.get('conflict'):
+            return None
+        with _lock:
+            _stats['location_writes'] += 1
+
+        update_data = {field: value for field, value in (written.get('location') or {}).items() if original.get(field) != value}
+        if update_data:
+            row_cache.locations.patch(location_id, update_data)
+            snapshot.patch_location(location_id, update_data)
+            invalidation.publish('location', location_id, update_data)
+        for team in written.get('teams', []):
+            scoring.apply_team_update(team['id'], {
+                'points': team['points'],
+                'points_rate': team['points_rate'],
+                'points_since': team['points_since']
+            })
+        for removed_id in written.get('removed_owners', []):
+            deltas.record(removed_id, locations_owned=-1)
+        for added_id in written.get('added_owners', []):
+            deltas.record(added_id, locations_owned=1)
+
+    # Only now that every write went through do the tick's stat deltas become real
+    deltas.commit()
+    return results
+
+def _resolve(location_id, jobs):
+    """Run one tick for a location: one read, ordered outcomes, one atomic write"""
+    # Skip jobs whose request already gave up waiting
+    jobs = [job for job in jobs if job['future'].set_running_or_notify_cancel()]
+    if not jobs:
+        return
+
+    try:
+        supabase = get_supabase_client()
+        if not supabase:
+            raise RuntimeError('Database not configured')
+
+        results = None
+        for attempt in range(MAX_TICK_ATTEMPTS):
+            # Read-through the row cache, kept current by this worker's writes and the invalidation bus
+            location = row_cache.get_location(location_id)
+            with _lock:
+                _stats['location_lookups'] += 1
+
+            if location is None:
+                for job in jobs:
+                    job['future'].set_result(({'error': 'Location not found'}, 404))
+                return
+
+            results = _run_tick(supabase, location_id, location, jobs)
+            if results is not None:
+                break
+
+            # Another worker changed the location since it was cached, redo the tick from a fresh read
+            row_cache.locations.evict(location_id)
+            with _lock:
+                _stats['conflicts'] += 1
+
+        if results is None:
+            results = [({'error': 'Location is changing too quickly, it was not applied, try again'}, 503)] * len(jobs)
+
+        for job, result in zip(jobs, results):
+            job['future'].set_result(result)
+
+    except Exception as e:
+        print(f"[{datetime.now()}] Error resolving battles at location {location_id}: {str(e)}")
+        for job in jobs:
+            if not job['future'].done():
+                job['future'].set_result(({'error': str(e)}, 500))
+
+def _tick_loop():
+    """Background loop draining every location's queue once per tick"""
+    with ThreadPoolExecutor(max_workers=RESOLVE_WORKERS) as executor:
+        while True:
+            started = time.monotonic()
+
+            with _lock:
+                batch = dict(_queues)
+                _queues.clear()
+                if batch:
+                    _stats['ticks'] += 1
+                    _stats['jobs'] += sum(len(jobs) for jobs in batch.values())
+
+            # Wait for the whole tick so a location is never resolved twice concurrently
+            list(executor.map(lambda item: _resolve(*item), batch.items()))
+
+            time.sleep(max(0.0, TICK_INTERVAL - (time.monotonic() - started)))
+
+def _ensure_ticker():
+    global _ticker
+    if _ticker is not None:
+        return
+    with _lock:
+        if _ticker is not None:
+            return
+        _ticker = threading.Thread(target=_tick_loop, daemon=True)
+        _ticker.start()
+
+def start():
+    """Start the tick loop (also started lazily on the first submit)"""
+    _ensure_ticker()
+
+def status():
+    """Tick counters for health reporting"""
+    with _lock:
+        return dict(_stats, queued=sum(len(jobs) for jobs in _queues.values()))
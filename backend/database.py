@@ -1,23 +1,41 @@
 """
 Database module for shared Supabase client access
+
+The client (and the supabase package itself, which is slow to import) is
+created lazily on the first call to get_supabase_client().
 """
 import os
-from supabase import create_client, Client
+import threading
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-# Initialize Supabase client
-supabase_url = os.getenv("SUPABASE_URL")
-supabase_key = os.getenv("SUPABASE_KEY")
+_supabase = None
+_initialized = False
+_init_lock = threading.Lock()
 
-if supabase_url and supabase_key:
-    supabase: Client = create_client(supabase_url, supabase_key)
-else:
-    supabase = None
-    print("Warning: Supabase credentials not found. Please set SUPABASE_URL and SUPABASE_KEY in .env file")
+def is_configured():
+    """Check whether Supabase credentials are present without creating the client"""
+    return bool(os.getenv("SUPABASE_URL") and os.getenv("SUPABASE_KEY"))
 
 def get_supabase_client():
-    """Get the Supabase client instance"""
-    return supabase
+    """Get the Supabase client instance, creating it on first use"""
+    global _supabase, _initialized
+    if _initialized:
+        return _supabase
+
+    with _init_lock:
+        if not _initialized:
+            supabase_url = os.getenv("SUPABASE_URL")
+            supabase_key = os.getenv("SUPABASE_KEY")
+
+            if supabase_url and supabase_key:
+                from supabase import create_client
+                _supabase = create_client(supabase_url, supabase_key)
+            else:
+                print("Warning: Supabase credentials not found. Please set SUPABASE_URL and SUPABASE_KEY in .env file")
+
+            _initialized = True
+
+    return _supabase
@@ -0,0 +1,147 @@
+"""
+Idempotency keys and duplicate-request suppression for mutating endpoints
+
+Clients send an `Idempotency-Key` header with a value that is unique per
+logical action. The first request with a key runs normally and its response
+is kept for KEY_TTL seconds, repeats with the same key get the stored
+response back without running the endpoint again, and duplicates arriving
+while the first is still running wait for it and share its response.
+Keys are scoped per endpoint and per authenticated user.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import request, jsonify, g, make_response, Response
+
+# Constants
+KEY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+KEY_TTL = 600  # Seconds a completed response is kept for replay
+MAX_KEYS = 10000  # Bound on stored keys, the oldest completed ones are dropped first
+FULL_RETRY_AFTER = 1  # Seconds a client is asked to wait when every stored key is still in flight
+MAX_KEY_LENGTH = 255
+WAIT_TIMEOUT = 15  # Seconds a duplicate waits for the in-flight original
+
+class IdempotencyStore:
+    """Bounded, time-expiring map of scoped keys to in-flight or completed responses"""
+
+    def __init__(self, ttl=KEY_TTL, maxsize=MAX_KEYS):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'executed': 0, 'replayed': 0, 'coalesced': 0, 'conflicts': 0, 'rejected_full': 0}
+
+    def begin(self, scope, fingerprint):
+        """Claim a key, returns (entry, is_owner), or (None, False) if the store is full of in-flight keys"""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get(scope)
+            if entry is not None:
+                return entry, False
+
+            # In-flight keys are never dropped, a duplicate arriving later must still find them
+            if len(self._entries) >= self.maxsize and not self._evict_completed():
+                self._stats['rejected_full'] += 1
+                return None, False
+
+            entry = {
+                'fingerprint': fingerprint,
+                'expires_at': now + self.ttl,
+                'done': threading.Event(),
+                'response': None
+            }
+            self._entries[scope] = entry
+            self._stats['executed'] += 1
+            return entry, True
+
+    def complete(self, scope, entry, response):
+        """Store a finished response, or forget the key so a retry runs again (response=None)"""
+        with self._lock:
+            if response is None and self._entries.get(scope) is entry:
+                del self._entries[scope]
+            entry['response'] = response
+            entry['expires_at'] = time.monotonic() + self.ttl
+        entry['done'].set()
+
+    def count(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, keys=len(self._entries))
+
+    def _evict_completed(self):
+        """Drop the oldest completed entry, False if every entry is still in flight"""
+        for scope, entry in self._entries.items():
+            if entry['done'].is_set():
+                del self._entries[scope]
+                return True
+        return False
+
+    def _expire(self, now):
+        expired = [scope for scope, entry in self._entries.items()
+                   if entry['done'].is_set() and entry['expires_at'] < now]
+        for scope in expired:
+            del self._entries[scope]
+
+store = IdempotencyStore()
+
+def _replay(stored):
+    body, status, content_type = stored
+    response = Response(body, status=status, content_type=content_type)
+    response.headers[REPLAYED_HEADER] = 'true'
+    return response
+
+def idempotent(f):
+    """Decorator returning the stored response for repeated Idempotency-Key requests (apply after require_auth)"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        key = request.headers.get(KEY_HEADER)
+        if not key:
+            return f(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({'error': 'Idempotency-Key is too long'}), 400
+
+        scope = (request.path, getattr(g, 'user_id', None), key)
+        fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+        entry, is_owner = store.begin(scope, fingerprint)
+        if entry is None:
+            response = jsonify({'error': 'Too many requests in progress, try again shortly'})
+            response.status_code = 503
+            response.headers['Retry-After'] = str(FULL_RETRY_AFTER)
+            return response
+
+        if not is_owner:
+            if entry['fingerprint'] != fingerprint:
+                store.count('conflicts')
+                return jsonify({'error': 'Idempotency-Key was already used for a different request'}), 422
+
+            if not entry['done'].is_set():
+                store.count('coalesced')
+                if not entry['done'].wait(WAIT_TIMEOUT):
+                    return jsonify({'error': 'A request with this Idempotency-Key is still in progress'}), 409
+
+            if entry['response'] is None:
+                return jsonify({'error': 'The original request with this Idempotency-Key failed, retry with the same key'}), 409
+
+            store.count('replayed')
+            return _replay(entry['response'])
+
+        try:
+            response = make_response(f(*args, **kwargs))
+        except Exception:
+            store.complete(scope, entry, None)
+            raise
+
+        # Server errors are not stored so the client can retry them
+        if response.status_code >= 500:
+            store.complete(scope, entry, None)
+        else:
+            store.complete(scope, entry, (response.get_data(), response.status_code, response.content_type))
+        return response
+    return decorated_function
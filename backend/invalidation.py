@@ -0,0 +1,252 @@
+"""
+Cross-worker cache coherence via a pub/sub invalidation bus
+
+Writes publish versioned change events ({entity, id, version, origin,
+fields}) and every worker applies events from other workers to its local
+state: a handler receives the changed fields to patch, or None to evict.
+The version is a sequence number of the publishing worker, so it is only
+compared with earlier events from the same origin: an event older than the
+last one applied from that origin for the same entity/id is dropped, while
+events from different origins are never compared (their clocks may be
+skewed). Ordering across origins follows the backend's delivery order, and
+the row cache TTL and periodic snapshot reconcile bound any leftover
+staleness.
+
+The backend is chosen with INVALIDATION_BUS:
+    (unset)                    in-process loopback, single worker
+    unix:///tmp/uventure-bus   Unix datagram sockets, workers on one host
+    redis://host:6379/0        Redis pub/sub, workers across nodes (needs the redis package)
+"""
+import glob
+import itertools
+import json
+import os
+import socket
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+# Constants
+REDIS_CHANNEL = 'uventure:invalidation'
+MAX_MESSAGE_SIZE = 65507  # Largest datagram we send or receive
+MAX_TRACKED_VERSIONS = 100000  # Bound on remembered (origin, entity, id) versions, least recently seen dropped first
+
+class LoopbackBackend:
+    """In-process backend, buses created with the same hub name see each other's events"""
+    _hubs = {}
+    _hubs_lock = threading.Lock()
+
+    def __init__(self, hub='default'):
+        self.hub = hub
+        self._callback = None
+
+    def publish(self, message):
+        with self._hubs_lock:
+            callbacks = list(self._hubs.get(self.hub, []))
+        for callback in callbacks:
+            callback(message)
+
+    def listen(self, callback):
+        self._callback = callback
+        with self._hubs_lock:
+            self._hubs.setdefault(self.hub, []).append(callback)
+
+    def close(self):
+        with self._hubs_lock:
+            if self._callback in self._hubs.get(self.hub, []):
+                self._hubs[self.hub].remove(self._callback)
+
+class UnixSocketBackend:
+    """Each worker binds a datagram socket in a shared directory, publishing sends to all of them"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, f"{os.getpid()}-{uuid.uuid4().hex[:8]}.sock")
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._receiver = None
+
+    def publish(self, message):
+        for path in glob.glob(os.path.join(self.directory, '*.sock')):
+            try:
+                self._sender.sendto(message, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Socket left behind by a worker that exited
+                if path != self.path:
+                    try:
+                        os.unlink(path)
+                    except OSError:
+                        pass
+            except OSError as e:
+                print(f"[{datetime.now()}] Failed to send invalidation to {path}: {str(e)}")
+
+    def listen(self, callback):
+        os.makedirs(self.directory, exist_ok=True)
+        self._receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._receiver.bind(self.path)
+
+        def receive_loop():
+            while True:
+                try:
+                    message = self._receiver.recv(MAX_MESSAGE_SIZE)
+                except OSError:
+                    return
+                callback(message)
+
+        threading.Thread(target=receive_loop, daemon=True).start()
+
+    def close(self):
+        if self._receiver:
+            self._receiver.close()
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+        self._sender.close()
+
+class RedisBackend:
+    """Redis pub/sub backend for workers spread over several nodes"""
+
+    def __init__(self, url, channel=REDIS_CHANNEL):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("The redis package is required for a redis:// INVALIDATION_BUS")
+        self.channel = channel
+        self._client = redis.Redis.from_url(url)
+        self._pubsub = None
+
+    def publish(self, message):
+        self._client.publish(self.channel, message)
+
+    def listen(self, callback):
+        self._pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(self.channel)
+
+        def receive_loop():
+            for item in self._pubsub.listen():
+                if item.get('type') == 'message':
+                    callback(item['data'])
+
+        threading.Thread(target=receive_loop, daemon=True).start()
+
+    def close(self):
+        if self._pubsub:
+            self._pubsub.close()
+        self._client.close()
+
+class InvalidationBus:
+    """Publishes change events and dispatches other workers' events to subscribed handlers"""
+
+    def __init__(self, backend, worker_id=None):
+        self.backend = backend
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._handlers = {}
+        self._sequence = itertools.count(1)
+        self._versions = OrderedDict()  # (origin, entity, id) -> last applied version
+        self._lock = threading.Lock()
+        self._started = False
+        self._stats = {'published': 0, 'received': 0, 'applied': 0, 'stale': 0, 'errors': 0}
+
+    def subscribe(self, entity, handler):
+        """Register handler(entity_id, fields) for changes to an entity type"""
+        with self._lock:
+            self._handlers.setdefault(entity, []).append(handler)
+
+    def publish(self, entity, entity_id, fields=None):
+        """Announce that a row changed, fields=None asks subscribers to evict it"""
+        with self._lock:
+            event = {
+                'entity': entity,
+                'id': entity_id,
+                'version': next(self._sequence),
+                'origin': self.worker_id,
+                'fields': fields
+            }
+            self._stats['published'] += 1
+        try:
+            self.backend.publish(json.dumps(event, default=str).encode('utf-8'))
+        except Exception as e:
+            with self._lock:
+                self._stats['errors'] += 1
+            print(f"[{datetime.now()}] Failed to publish {entity} {entity_id} invalidation: {str(e)}")
+
+    def start(self):
+        """Begin receiving events from other workers"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        self.backend.listen(self._receive)
+
+    def close(self):
+        self.backend.close()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, worker_id=self.worker_id)
+
+    def _receive(self, message):
+        try:
+            event = json.loads(message)
+        except (ValueError, TypeError):
+            with self._lock:
+                self._stats['errors'] += 1
+            return
+
+        if event.get('origin') == self.worker_id:
+            return
+
+        key = (event.get('origin'), event.get('entity'), event.get('id'))
+        with self._lock:
+            self._stats['received'] += 1
+            if self._versions.get(key, 0) >= event.get('version', 0):
+                self._stats['stale'] += 1
+                return
+            self._versions[key] = event['version']
+            self._versions.move_to_end(key)
+            while len(self._versions) > MAX_TRACKED_VERSIONS:
+                self._versions.popitem(last=False)
+            handlers = list(self._handlers.get(event.get('entity'), []))
+
+        for handler in handlers:
+            try:
+                handler(event['id'], event.get('fields'))
+                with self._lock:
+                    self._stats['applied'] += 1
+            except Exception as e:
+                with self._lock:
+                    self._stats['errors'] += 1
+                print(f"[{datetime.now()}] Error applying {key[1]} {key[2]} invalidation: {str(e)}")
+
+def create_backend(url=None):
+    """Build a backend from an INVALIDATION_BUS style url"""
+    url = url if url is not None else os.getenv('INVALIDATION_BUS', '')
+    if not url:
+        return LoopbackBackend()
+    if url.startswith('unix://'):
+        return UnixSocketBackend(url[len('unix://'):])
+    if url.startswith(('redis://', 'rediss://')):
+        return RedisBackend(url)
+    raise ValueError(f"Unsupported INVALIDATION_BUS: {url}")
+
+_bus = None
+_bus_lock = threading.Lock()
+
+def get_bus():
+    """Get the process-wide invalidation bus, creating it on first use"""
+    global _bus
+    if _bus is None:
+        with _bus_lock:
+            if _bus is None:
+                _bus = InvalidationBus(create_backend())
+    return _bus
+
+def publish(entity, entity_id, fields=None):
+    get_bus().publish(entity, entity_id, fields)
+
+def subscribe(entity, handler):
+    get_bus().subscribe(entity, handler)
+
+def start():
+    get_bus().start()
@@ -0,0 +1,251 @@
+"""
+Per-team points history in downsampled, bounded-memory time series
+
+Team scores are sampled every SAMPLE_INTERVAL seconds and whenever a score
+is materialized. Each sample is rolled up into 1-minute, 10-minute and
+hourly series. Each series is a fixed-capacity ring buffer of bucket start
+times and end-of-bucket scores, stored in typed arrays. Range queries
+binary-search the buffer of the requested resolution. The series are
+persisted to local disk periodically so history survives restarts.
+"""
+import array
+import atexit
+import json
+import os
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from database import get_supabase_client
+import scoring
+import snapshot
+
+# Constants
+SAMPLE_INTERVAL = 60  # Seconds between samples of every team's score
+SAVE_INTERVAL = 600  # Seconds between writes of the history file (only written when changed)
+HISTORY_PATH = os.getenv('POINTS_HISTORY_PATH') or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'instance', 'points_history.bin'
+)
+
+# Resolution name -> (bucket seconds, buckets kept)
+RESOLUTIONS = {
+    '1m': (60, 7 * 24 * 60),  # One week
+    '10m': (600, 30 * 24 * 6),  # 30 days
+    '1h': (3600, 180 * 24)  # 180 days, a season
+}
+COARSEST_RESOLUTION = '1h'
+MAX_POINTS = 5000  # Upper bound on points returned by one query, a season fits at hourly resolution
+
+class RingSeries:
+    """Fixed-capacity ring buffer of (bucket start, value) keeping the last value per bucket"""
+
+    def __init__(self, bucket_seconds, capacity):
+        self.bucket_seconds = bucket_seconds
+        self.capacity = capacity
+        self._starts = array.array('q', bytes(8 * capacity))
+        self._values = array.array('q', bytes(8 * capacity))
+        self._head = 0  # Index of the oldest bucket
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def _index(self, position):
+        return (self._head + position) % self.capacity
+
+    def last_start(self):
+        return self._starts[self._index(self._count - 1)] if self._count else None
+
+    def add(self, timestamp, value):
+        """Record a value; samples older than the newest bucket are ignored"""
+        start = int(timestamp) // self.bucket_seconds * self.bucket_seconds
+        last = self.last_start()
+        if last is not None and start < last:
+            return False
+        if start == last:
+            self._values[self._index(self._count - 1)] = value
+            return True
+
+        if self._count < self.capacity:
+            index = self._index(self._count)
+            self._count += 1
+        else:
+            # Overwrite the oldest bucket
+            index = self._head
+            self._head = (self._head + 1) % self.capacity
+        self._starts[index] = start
+        self._values[index] = value
+        return True
+
+    def _bisect(self, timestamp):
+        """First position whose bucket starts at or after timestamp"""
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._starts[self._index(middle)] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def range(self, start, end):
+        """(bucket start, value) pairs for buckets overlapping [start, end]"""
+        first = self._bisect(int(start) // self.bucket_seconds * self.bucket_seconds)
+        last = self._bisect(int(end) + 1)
+        return [(self._starts[self._index(position)], self._values[self._index(position)])
+                for position in range(first, last)]
+
+    def to_list(self):
+        return [[self._starts[self._index(position)], self._values[self._index(position)]]
+                for position in range(self._count)]
+
+_series = {}  # team_id -> {resolution: RingSeries}
+_lock = threading.Lock()
+_dirty = False
+_generation = 0  # Bumped on every change, so a save only clears _dirty if nothing changed meanwhile
+_started = False
+
+def _team_series(team_id):
+    series = _series.get(team_id)
+    if series is None:
+        series = {name: RingSeries(bucket_seconds, capacity) for name, (bucket_seconds, capacity) in RESOLUTIONS.items()}
+        _series[team_id] = series
+    return series
+
+def record(team_id, points, timestamp=None):
+    """Add a score sample for a team to every resolution"""
+    global _dirty, _generation
+    if team_id is None:
+        return
+    timestamp = timestamp if timestamp is not None else time.time()
+    with _lock:
+        for ring in _team_series(team_id).values():
+            if ring.add(timestamp, int(points)):
+                _dirty = True
+                _generation += 1
+
+def query(team_id, start, end, resolution):
+    """Samples of a team between two unix timestamps at a resolution"""
+    with _lock:
+        series = _series.get(team_id)
+        if series is None:
+            return []
+        return series[resolution].range(start, end)
+
+def pick_resolution(start, end):
+    """Finest resolution whose retention reaches back to start and whose point count stays under MAX_POINTS"""
+    now = time.time()
+    for name, (bucket_seconds, capacity) in RESOLUTIONS.items():
+        if start >= now - bucket_seconds * capacity and (end - start) / bucket_seconds <= MAX_POINTS:
+            return name
+    return COARSEST_RESOLUTION
+
+def sample(now=None):
+    """Record the current score of every team"""
+    now = now or datetime.now(timezone.utc)
+    teams = snapshot.get_teams()
+    if teams is None:
+        supabase = get_supabase_client()
+        if not supabase:
+            return 0
+        response = supabase.table('teams').select('id, points, points_rate, points_since').execute()
+        teams = {team['id']: team for team in response.data or []}
+
+    timestamp = now.timestamp()
+    for team_id, team in teams.items():
+        record(team_id, scoring.current_points(team, now), timestamp)
+    return len(teams)
+
+def save(path=HISTORY_PATH):
+    """Atomically write all series to disk"""
+    global _dirty
+    with _lock:
+        payload = {
+            str(team_id): {name: ring.to_list() for name, ring in series.items()}
+            for team_id, series in _series.items()
+        }
+        generation = _generation
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as file:
+        file.write(zlib.compress(json.dumps(payload, separators=(',', ':')).encode('utf-8')))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+
+    # Only clean once the file is in place, so a failed write is retried at the next save
+    with _lock:
+        if _generation == generation:
+            _dirty = False
+
+def load(path=HISTORY_PATH):
+    """Load series written by save(), returns the number of teams loaded"""
+    if not os.path.exists(path):
+        return 0
+    with open(path, 'rb') as file:
+        payload = json.loads(zlib.decompress(file.read()).decode('utf-8'))
+
+    with _lock:
+        for team_id, series in payload.items():
+            team_series = _team_series(int(team_id))
+            for name, points in series.items():
+                if name not in team_series:
+                    continue
+                for start, value in points:
+                    team_series[name].add(start, value)
+    return len(payload)
+
+def clear():
+    """Drop all series (used by tests)"""
+    global _dirty
+    with _lock:
+        _series.clear()
+        _dirty = False
+
+def status():
+    """Series sizes for health reporting"""
+    with _lock:
+        return {
+            'teams': len(_series),
+            'buckets': {name: sum(len(series[name]) for series in _series.values()) for name in RESOLUTIONS}
+        }
+
+def _save_if_dirty():
+    if _dirty:
+        save()
+
+def _history_loop():
+    """Background task to sample team scores and periodically persist the history"""
+    last_saved = time.monotonic()
+    while True:
+        try:
+            sample()
+        except Exception as e:
+            print(f"[{datetime.now()}] Error sampling team points: {str(e)}")
+
+        if _dirty and time.monotonic() - last_saved >= SAVE_INTERVAL:
+            try:
+                save()
+                last_saved = time.monotonic()
+            except Exception as e:
+                print(f"[{datetime.now()}] Error writing points history: {str(e)}")
+
+        time.sleep(SAMPLE_INTERVAL)
+
+def start():
+    """Load the stored history, then sample and persist in the background"""
+    global _started
+    with _lock:
+        if _started:
+            return
+        _started = True
+
+    try:
+        teams_loaded = load()
+        print(f"[{datetime.now()}] Loaded points history for {teams_loaded} teams")
+    except Exception as e:
+        print(f"[{datetime.now()}] Error loading points history: {str(e)}")
+
+    atexit.register(_save_if_dirty)
+    threading.Thread(target=_history_loop, daemon=True).start()
@@ -0,0 +1,182 @@
+"""
+Bulk account provisioning for orientation events
+
+Used by the /api/auth/bulk_create_accounts endpoint and runnable directly:
+
+    python provisioning.py users.csv
+
+The CSV (or JSON list) has username, password and optional team columns.
+"""
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from werkzeug.security import generate_password_hash
+from database import get_supabase_client
+
+# Constants
+LOOKUP_CHUNK_SIZE = 500  # Usernames per in_() collision query (keeps the request URL bounded)
+INSERT_CHUNK_SIZE = 500  # Rows per batch insert
+MAX_ACCOUNTS = 10000  # Largest cohort accepted in one call
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def _hash_passwords(passwords, use_processes=False):
+    """Hash passwords in parallel across all cores
+
+    Threads are enough because hashlib releases the GIL while hashing. A
+    process pool is only used from the command line, with a spawn context,
+    since forking the multi-threaded server can deadlock the children.
+    """
+    if len(passwords) < 2:
+        return [generate_password_hash(password) for password in passwords]
+
+    workers = os.cpu_count() or 1
+    if not use_processes:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(generate_password_hash, passwords))
+
+    chunksize = max(1, len(passwords) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return list(executor.map(generate_password_hash, passwords, chunksize=chunksize))
+
+def _validate(users):
+    """Split input rows into valid accounts and per-row failures"""
+    valid = []
+    failures = []
+    seen = set()
+
+    for index, user in enumerate(users):
+        if not isinstance(user, dict):
+            failures.append({'index': index, 'username': None, 'error': 'Row must be an object'})
+            continue
+
+        username = user.get('username')
+        password = user.get('password')
+        team = user.get('team')
+
+        if username is not None and not isinstance(username, str):
+            failures.append({'index': index, 'username': None, 'error': 'Username must be a string'})
+        elif password is not None and not isinstance(password, str):
+            failures.append({'index': index, 'username': username, 'error': 'Password must be a string'})
+        elif not username or not password:
+            failures.append({'index': index, 'username': username, 'error': 'Username and password are required'})
+        elif team is not None and (not isinstance(team, int) or isinstance(team, bool)):
+            failures.append({'index': index, 'username': username, 'error': 'Team must be an integer'})
+        elif username in seen:
+            failures.append({'index': index, 'username': username, 'error': 'Duplicate username in request'})
+        else:
+            seen.add(username)
+            valid.append((index, user))
+
+    return valid, failures
+
+def _existing_usernames(supabase, usernames):
+    """Find which usernames are already taken with chunked in_() queries"""
+    existing = set()
+    for chunk in _chunks(usernames, LOOKUP_CHUNK_SIZE):
+        response = supabase.table('users').select('username').in_('username', chunk).execute()
+        if response.data:
+            existing.update(row['username'] for row in response.data)
+    return existing
+
+def _insert_chunk(supabase, chunk):
+    """Insert a chunk of (index, row) pairs, falling back to single rows to pinpoint failures"""
+    created = []
+    failures = []
+
+    try:
+        response = supabase.table('users').insert([row for _, row in chunk]).execute()
+        if response.data:
+            return [row['username'] for _, row in chunk], failures
+    except Exception:
+        pass
+
+    for index, row in chunk:
+        try:
+            response = supabase.table('users').insert(row).execute()
+            if response.data:
+                created.append(row['username'])
+            else:
+                failures.append({'index': index, 'username': row['username'], 'error': 'Failed to create account'})
+        except Exception as e:
+            failures.append({'index': index, 'username': row['username'], 'error': str(e)})
+
+    return created, failures
+
+def provision_accounts(users, use_processes=False):
+    """Create many accounts at once, returns {'created': [...], 'failed': [...]}"""
+    supabase = get_supabase_client()
+    if not supabase:
+        raise RuntimeError('Database not configured')
+    if len(users) > MAX_ACCOUNTS:
+        raise ValueError(f'At most {MAX_ACCOUNTS} accounts can be provisioned at once')
+
+    valid, failures = _validate(users)
+
+    # Drop usernames that already exist before paying for any hashing
+    existing = _existing_usernames(supabase, [user['username'] for _, user in valid])
+    to_create = []
+    for index, user in valid:
+        if user['username'] in existing:
+            failures.append({'index': index, 'username': user['username'], 'error': 'Username already exists'})
+        else:
+            to_create.append((index, user))
+
+    password_hashes = _hash_passwords([user['password'] for _, user in to_create], use_processes)
+
+    rows = [
+        (index, {
+            'username': user['username'],
+            'password_hash': password_hash,
+            'team': user.get('team'),
+            'strength': 0,
+            'image': user.get('image')
+        })
+        for (index, user), password_hash in zip(to_create, password_hashes)
+    ]
+
+    created = []
+    for chunk in _chunks(rows, INSERT_CHUNK_SIZE):
+        chunk_created, chunk_failures = _insert_chunk(supabase, chunk)
+        created.extend(chunk_created)
+        failures.extend(chunk_failures)
+
+    failures.sort(key=lambda failure: failure['index'])
+    return {'created': created, 'failed': failures}
+
+def _load_users(path):
+    """Read users from a CSV file with a header row, or a JSON list"""
+    with open(path, 'r') as file:
+        if path.endswith('.json'):
+            return json.load(file)
+
+        users = []
+        for row in csv.DictReader(file):
+            team = (row.get('team') or '').strip()
+            if team.lstrip('-').isdigit():
+                team = int(team)
+            users.append({
+                'username': row.get('username'),
+                'password': row.get('password'),
+                'team': None if team == '' else team  # Non-numeric teams are reported as row failures
+            })
+        return users
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print("Usage: python provisioning.py <users.csv|users.json>")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    result = provision_accounts(_load_users(sys.argv[1]), use_processes=True)
+    elapsed = time.perf_counter() - start
+
+    for failure in result['failed']:
+        print(f"Row {failure['index']} ({failure['username']}): {failure['error']}")
+    print(f"Created {len(result['created'])} accounts, {len(result['failed'])} failed in {elapsed:.1f}s")
@@ -1,15 +1,14 @@
+import hmac
 import os
 import jwt
 from datetime import datetime, timedelta
 from flask import Blueprint, request, jsonify
 from werkzeug.security import generate_password_hash, check_password_hash
 from database import get_supabase_client
+from provisioning import provision_accounts
 
 auth_bp = Blueprint('auth', __name__)
 
-# Get Supabase client
-supabase = get_supabase_client()
-
 def generate_jwt_token(user_id):
     """Generate JWT token for user"""
     payload = {
@@ -27,6 +26,7 @@ def generate_jwt_token(user_id):
 @auth_bp.route('/create_account', methods=['POST'])
 def create_account():
     """Create a new user account"""
+    supabase = get_supabase_client()
     if not supabase:
         return jsonify({'error': 'Database not configured'}), 500
     
@@ -77,6 +77,7 @@ def create_account():
 @auth_bp.route('/sign_in', methods=['POST'])
 def sign_in():
     """Sign in user and return JWT token"""
+    supabase = get_supabase_client()
     if not supabase:
         return jsonify({'error': 'Database not configured'}), 500
     
@@ -113,3 +114,35 @@ def sign_in():
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+@auth_bp.route('/bulk_create_accounts', methods=['POST'])
+def bulk_create_accounts():
+    """Create many accounts at once with team assignments (admin only)"""
+    supabase = get_supabase_client()
+    if not supabase:
+        return jsonify({'error': 'Database not configured'}), 500
+    
+    admin_key = os.getenv('ADMIN_API_KEY')
+    if not admin_key:
+        return jsonify({'error': 'Admin key not configured'}), 500
+    provided_key = request.headers.get('X-Admin-Key', '')
+    if not hmac.compare_digest(provided_key.encode('utf-8'), admin_key.encode('utf-8')):
+        return jsonify({'error': 'Admin key required'}), 401
+    
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
+        
+        users = data.get('users')
+        if not isinstance(users, list) or not users:
+            return jsonify({'error': 'Users must be a non-empty list'}), 400
+        
+        result = provision_accounts(users)
+        
+        return jsonify(result), 200
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
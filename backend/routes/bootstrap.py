@@ -0,0 +1,76 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from flask import Blueprint, request, jsonify, g
+from database import get_supabase_client
+import admission
+import row_cache
+import scoring
+import snapshot
+from routes.locations import load_locations, build_location_object
+from routes.profile import require_auth, load_profile
+
+bootstrap_bp = Blueprint('bootstrap', __name__)
+
+# Constants
+SUB_QUERIES = 3  # Sub-queries each bootstrap request runs concurrently
+
+def _pool_size():
+    """BOOTSTRAP_WORKERS, or enough threads for every bootstrap the admission class lets run at once"""
+    try:
+        return max(1, int(os.getenv('BOOTSTRAP_WORKERS', '')))
+    except ValueError:
+        return admission.classes['bootstrap'].limit * SUB_QUERIES
+
+# Shared pool for the concurrent sub-queries of bootstrap requests, admission bounds how many use it at once
+_executor = ThreadPoolExecutor(max_workers=_pool_size(), thread_name_prefix='bootstrap')
+
+def _load_teams(supabase):
+    """Team rows keyed by id, also used to join team names onto locations"""
+    teams = snapshot.get_teams()
+    if teams is None:
+        teams_response = supabase.table('teams').select('id, name, color, points, points_rate, points_since').execute()
+        teams = {team['id']: team for team in teams_response.data or []}
+    return teams
+
+@bootstrap_bp.route('', methods=['GET'])
+@require_auth
+def bootstrap():
+    """Get everything the client needs at launch: profile, team, all teams and locations"""
+    supabase = get_supabase_client()
+    if not supabase:
+        return jsonify({'error': 'Database not configured'}), 500
+
+    try:
+        user_id = g.user_id
+        # Base64 images are left out unless asked for with ?images=1
+        include_images = request.args.get('images') in ('1', 'true')
+
+        # Run the independent sub-queries concurrently
+        profile_future = _executor.submit(load_profile, supabase, user_id, include_images)
+        teams_future = _executor.submit(_load_teams, supabase)
+        locations_future = _executor.submit(load_locations, supabase, include_images)
+
+        profile = profile_future.result()
+        if profile is None:
+            return jsonify({'error': 'User not found'}), 404
+        if not include_images:
+            profile.pop('image', None)
+
+        teams_dict = teams_future.result()
+        teams = [scoring.with_current_points(teams_dict[team_id]) for team_id in sorted(teams_dict)]
+        team = next((team for team in teams if team['id'] == profile.get('team')), None)
+        if team is None and profile.get('team') is not None:
+            # Team created after the world state was loaded
+            team_row = row_cache.get_team(profile['team'])
+            team = scoring.with_current_points(team_row) if team_row else None
+
+        return jsonify({
+            'profile': dict(profile, id=user_id),
+            'team': team,
+            'teams': teams,
+            'locations': [build_location_object(location, teams_dict, include_image=include_images)
+                          for location in locations_future.result()]
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
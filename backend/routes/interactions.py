@@ -1,16 +1,16 @@
 import os
 import jwt
-import random
 from functools import wraps
 from flask import Blueprint, request, jsonify, g
-from datetime import datetime
 from database import get_supabase_client
+from idempotency import idempotent
+import battle_queue
+import row_cache
+import sharding
+import snapshot
 
 interactions_bp = Blueprint('interactions', __name__)
 
-# Get Supabase client
-supabase = get_supabase_client()
-
 def require_auth(f):
     """Decorator to require authentication for endpoints"""
     @wraps(f)
@@ -51,9 +51,12 @@ def require_auth(f):
     return decorated_function
 
 @interactions_bp.route('/battle', methods=['POST'])
+@sharding.routed_by_location(sharding.location_from_body)
 @require_auth
+@idempotent
 def battle():
     """Start and end battle at some location, will change ownership if you win"""
+    supabase = get_supabase_client()
     if not supabase:
         print("oh nooo")
         return jsonify({'error': 'Database not configured'}), 500
@@ -77,100 +80,29 @@ def battle():
         if not isinstance(score, int):
             return jsonify({'error': 'Score must be an integer'}), 400
         
-        # Get user information (team, strength, and current win/loss counts)
-        user_response = supabase.table('users').select('team, strength, wins, losses').eq('id', user_id).execute()
-        if not user_response.data:
+        # Get user information (team and strength, pending stat deltas are applied in the tick)
+        user = row_cache.get_user(user_id)
+        if not user:
             return jsonify({'error': 'User not found'}), 404
         
-        user = user_response.data[0]
-        user_team = user.get('team')
-        user_strength = user.get('strength', 0)
-        current_wins = user.get('wins', 0)
-        current_losses = user.get('losses', 0)
-        
-        if not user_team:
+        if not user.get('team'):
             return jsonify({'error': 'User must be assigned to a team to battle'}), 400
         
-        # Get location information
-        location_response = supabase.table('locations').select('*').eq('id', location_id).execute()
-        if not location_response.data:
-            return jsonify({'error': 'Location not found'}), 404
-        
-        location = location_response.data[0]
-        current_owner_team = location.get('owner_team')
-        current_strongest_owner_id = location.get('strongest_owner_id')
-        
-        # Check if user's team already owns the location
-        if current_owner_team == user_team:
-            return jsonify({'error': 'Your team already owns this location'}), 400
-        
-        # Get the strength of the strongest owner to use as battle threshold
-        battle_threshold = 0
-        strongest_owner_data = None
-        if current_strongest_owner_id:
-            strongest_response = supabase.table('users').select('strength, wins, losses').eq('id', current_strongest_owner_id).execute()
-            if strongest_response.data:
-                strongest_owner_data = strongest_response.data[0]
-                battle_threshold = strongest_owner_data.get('strength', 0)
-        
-        # Calculate battle result based on score and user strength vs strongest owner's strength
-        total_power = score + user_strength
-        
-        # Determine if user wins
-        # wins = total_power > battle_threshold
-        wins = data.get('result') == 'win'
-        
-        # Calculate strength change (-1 to 3 inclusive, clamped between 0 and 100)
-        strength_change = random.randint(-1, 3)
-        new_strength = max(0, min(100, user_strength + strength_change))
-        
-        # Update user's last_battle timestamp and battle stats
-        if wins:
-            # Increment wins count for the winner
-            supabase.table('users').update({
-                'last_battle': datetime.utcnow().isoformat(),
-                'wins': current_wins + 1,
-                'strength': new_strength
-            }).eq('id', user_id).execute()
-            
-            # Increment losses count for the defeated strongest owner
-            if current_strongest_owner_id and strongest_owner_data:
-                current_strongest_losses = strongest_owner_data.get('losses', 0)
-                supabase.table('users').update({
-                    'losses': current_strongest_losses + 1
-                }).eq('id', current_strongest_owner_id).execute()
-        else:
-            # Increment losses count for the challenger
-            supabase.table('users').update({
-                'last_battle': datetime.utcnow().isoformat(),
-                'losses': current_losses + 1,
-                'strength': new_strength
-            }).eq('id', user_id).execute()
-        
-        if wins:
-            # Team ownership change - set new team as owner and reset ownership
-            # update_data = {
-            #     'owner_team': user_team,
-            #     'owner_count': 1,
-            #     'owned_since': datetime.utcnow().isoformat(),
-            #     'strongest_owner_id': user_id
-            # }
-            
-            # # Apply location updates
-            # supabase.table('locations').update(update_data).eq('id', location_id).execute()
-            
-            return jsonify({'message': 'win'}), 200
-        else:
-            return jsonify({'message': 'lose'}), 200
+        # Resolve the battle together with everything else queued at this location in the next tick
+        body, status = battle_queue.submit(location_id, 'battle', user_id, user, data)
+        return jsonify(body), status
         
     except Exception as e:
         print(str(e))
         return jsonify({'error': str(e)}), 500
 
 @interactions_bp.route('/become_owner', methods=['POST'])
+@sharding.routed_by_location(sharding.location_from_body)
 @require_auth
+@idempotent
 def become_owner():
     """Join your team's group of owners at a location"""
+    supabase = get_supabase_client()
     if not supabase:
         return jsonify({'error': 'Database not configured'}), 500
     
@@ -182,7 +114,6 @@ def become_owner():
         
         location_id = data.get('id')
         user_id = g.user_id
-        result = data.get('result')
         
         # Validate input
         if location_id is None:
@@ -191,50 +122,56 @@ def become_owner():
             return jsonify({'error': 'Location ID must be an integer'}), 400
         
         # Get user information
-        user_response = supabase.table('users').select('team, strength').eq('id', user_id).execute()
-        if not user_response.data:
+        user = row_cache.get_user(user_id)
+        if not user:
             return jsonify({'error': 'User not found'}), 404
         
-        user = user_response.data[0]
-        user_team = user.get('team')
-        user_strength = user.get('strength', 0)
-        
-        if not user_team:
+        if not user.get('team'):
             return jsonify({'error': 'User must be assigned to a team'}), 400
         
-        # Get location information
-        location_response = supabase.table('locations').select('owner_team, owner_count, strongest_owner_id').eq('id', location_id).execute()
-        if not location_response.data:
-            return jsonify({'error': 'Location not found'}), 404
-        
-        location = location_response.data[0]
-        location_owner_team = location.get('owner_team')
-        current_owner_count = location.get('owner_count', 0)
-        current_strongest_owner_id = location.get('strongest_owner_id')
+        # Join or take over the location in the next tick, with one consolidated location write
+        body, status = battle_queue.submit(location_id, 'become_owner', user_id, user, data)
+        return jsonify(body), status
         
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-        # Check if user's team owns the location
-        if result=='lose':
-            return jsonify({'message':"success"}), 200
-
+@interactions_bp.route('/check_ownership', methods=['POST'])
+@require_auth
+def check_ownership():
+    """Check whether the authenticated user is one of a location's owners"""
+    supabase = get_supabase_client()
+    if not supabase:
+        return jsonify({'error': 'Database not configured'}), 500
+    
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
         
+        location_id = data.get('location_id')
+        user_id = g.user_id
         
-        # Increment owner count (assuming this represents the user joining as an owner)
+        # Validate input
+        if location_id is None:
+            return jsonify({'error': 'Location ID is required'}), 400
+        if not isinstance(location_id, int):
+            return jsonify({'error': 'Location ID must be an integer'}), 400
         
-        # Update location data
-        update_data = {
-            'owner_count': 1
-        }
-        if location_owner_team == user_team:
-            update_data['owner_count'] = current_owner_count + 1
-
-        update_data['strongest_owner_id'] = user_id
-        update_data['owner_team'] = user_team
+        location = snapshot.get_location(location_id) or row_cache.get_location(location_id)
+        if not location:
+            return jsonify({'error': 'Location not found'}), 404
         
-                # Update the location
-        supabase.table('locations').update(update_data).eq('id', location_id).execute()
+        # Primary key lookup on location_owners
+        owner_response = supabase.table('location_owners').select('user_id').eq(
+            'location_id', location_id
+        ).eq('user_id', user_id).limit(1).execute()
         
-        return jsonify({'message':"success"}), 200
+        return jsonify({
+            'is_owner': bool(owner_response.data),
+            'is_strongest_owner': location.get('strongest_owner_id') == user_id,
+            'owner_team': location.get('owner_team')
+        }), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -1,84 +1,176 @@
-from flask import Blueprint, request, jsonify
+import json
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from database import get_supabase_client
+import row_cache
+import sharding
+import snapshot
 from datetime import datetime, timezone, timedelta
 
 locations_bp = Blueprint('locations', __name__)
 
-# Get Supabase client
-supabase = get_supabase_client()
-
 # Constants
 CAN_JOIN_PERIOD = 10  # 30 minutes in seconds
 
+DEFAULT_PAGE_SIZE = 100  # Locations per page when ?limit= is not given
+MAX_PAGE_SIZE = 500  # Upper bound on ?limit=
+STREAM_CHUNK_SIZE = 100  # Locations fetched from the database per chunk when streaming NDJSON
+
+# Location columns without the base64 image, for responses that omit it
+LOCATION_FIELDS_WITHOUT_IMAGE = 'id, name, latitude, longitude, owner_team, owner_count, owned_since, strongest_owner_id'
+
+def load_locations(supabase, include_image=True):
+    """All location rows, from the in-memory world state when it is loaded"""
+    locations = snapshot.get_locations()
+    if locations is None:
+        fields = '*' if include_image else LOCATION_FIELDS_WITHOUT_IMAGE
+        locations_response = supabase.table('locations').select(fields).execute()
+        locations = locations_response.data
+    return locations or []
+
+def load_location_page(supabase, after_id=None, limit=DEFAULT_PAGE_SIZE, include_image=True):
+    """Up to limit location rows with id greater than after_id, ordered by id (keyset pagination)"""
+    locations = snapshot.get_location_page(after_id, limit)
+    if locations is None:
+        fields = '*' if include_image else LOCATION_FIELDS_WITHOUT_IMAGE
+        query = supabase.table('locations').select(fields)
+        if after_id is not None:
+            query = query.gt('id', after_id)
+        locations = query.order('id').limit(limit).execute().data
+    return locations or []
+
+def iter_location_pages(supabase, after_id=None, chunk_size=STREAM_CHUNK_SIZE, include_image=True, limit=None):
+    """Yield successive pages of location rows until the table is exhausted or limit rows were yielded"""
+    remaining = limit
+    while remaining is None or remaining > 0:
+        page_size = chunk_size if remaining is None else min(chunk_size, remaining)
+        page = load_location_page(supabase, after_id, page_size, include_image)
+        if page:
+            yield page
+        if len(page) < page_size:
+            return
+        after_id = page[-1]['id']
+        if remaining is not None:
+            remaining -= len(page)
+
+def load_teams_by_id(supabase):
+    """Team rows keyed by id for joining team names and colors onto locations"""
+    teams_dict = snapshot.get_teams()
+    if teams_dict is None:
+        teams_response = supabase.table('teams').select('id, name, color').execute()
+        teams_dict = {team['id']: team for team in teams_response.data} if teams_response.data else {}
+    return teams_dict
+
+def build_location_object(location, teams_dict, include_image=True):
+    """Client-facing location object with can_join and owner team details"""
+    location_obj = {
+        'id': location.get('id'),
+        'name': location.get('name'),
+        'latitude': location.get('latitude'),  # Fixed typo from your spec
+        'longitude': location.get('longitude'),
+        'owner_team': location.get('owner_team'),
+        'owner_count': location.get('owner_count'),
+        'owned_since': location.get('owned_since'),
+        'strongest_owner_id': location.get('strongest_owner_id')
+    }
+    if include_image:
+        location_obj['image'] = location.get('image')
+    
+    # Calculate can_join based on owned_since timestamp
+    can_join = False
+    owned_since = location.get('owned_since')
+    if owned_since:
+        try:
+            # Parse the owned_since timestamp (assuming it's in ISO format)
+            owned_since_dt = datetime.fromisoformat(owned_since.replace('Z', '+00:00'))
+            # Convert to server's local timezone (UTC in this case)
+            if owned_since_dt.tzinfo is None:
+                owned_since_dt = owned_since_dt.replace(tzinfo=timezone.utc)
+            
+            # Get current server time
+            current_time = datetime.now(timezone.utc)
+            
+            # Calculate time difference in seconds
+            time_diff = (current_time - owned_since_dt).total_seconds()
+            
+            # Location can be joined if more than CAN_JOIN_PERIOD seconds have passed
+            can_join = time_diff > CAN_JOIN_PERIOD
+        except (ValueError, TypeError):
+            # If timestamp parsing fails, default to False
+            can_join = False
+    
+    location_obj['can_join'] = can_join
+    
+    # Add team information if owner_team exists
+    owner_team_id = location.get('owner_team')
+    if owner_team_id and owner_team_id in teams_dict:
+        team_info = teams_dict[owner_team_id]
+        location_obj['owner_team_color'] = team_info.get('color')
+        location_obj['owner_team_name'] = team_info.get('name')
+    else:
+        # Default values if no owner team or team not found
+        location_obj['owner_team_color'] = None
+        location_obj['owner_team_name'] = None
+    
+    return location_obj
+
+def wants_ndjson():
+    """Whether the client asked for a streamed NDJSON response"""
+    return request.args.get('format') == 'ndjson' or request.accept_mimetypes.best == 'application/x-ndjson'
+
+def stream_locations(supabase, after_id, limit=None):
+    """NDJSON response with one location object per line (at most limit), fetched from the database in chunks"""
+    teams_dict = load_teams_by_id(supabase)
+
+    def generate():
+        try:
+            for page in iter_location_pages(supabase, after_id, STREAM_CHUNK_SIZE, limit=limit):
+                yield ''.join(json.dumps(build_location_object(location, teams_dict)) + '\n' for location in page)
+        except Exception as e:
+            # Headers are already sent, so report the failure as a final line
+            print(f"[{datetime.now()}] Error streaming locations: {str(e)}")
+            yield json.dumps({'error': str(e)}) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @locations_bp.route('/get_locations', methods=['GET'])
 def get_locations():
     """Get all locations with complete information including team details"""
+    supabase = get_supabase_client()
     if not supabase:
         return jsonify({'error': 'Database not configured'}), 500
     
     try:
+        after_id = request.args.get('after_id', type=int)
+        limit = request.args.get('limit', type=int)
+        if 'after_id' in request.args and after_id is None:
+            return jsonify({'error': 'after_id must be an integer'}), 400
+        if 'limit' in request.args and (limit is None or not 1 <= limit <= MAX_PAGE_SIZE):
+            return jsonify({'error': f"limit must be an integer between 1 and {MAX_PAGE_SIZE}"}), 400
+        
+        if wants_ndjson():
+            return stream_locations(supabase, after_id, limit)
+        
+        if after_id is not None or limit is not None:
+            # One page, continue from next_after_id until it is null
+            limit = limit or DEFAULT_PAGE_SIZE
+            locations = load_location_page(supabase, after_id, limit)
+            teams_dict = load_teams_by_id(supabase) if locations else {}
+            return jsonify({
+                'data': [build_location_object(location, teams_dict) for location in locations],
+                'next_after_id': locations[-1]['id'] if len(locations) == limit else None
+            }), 200
+        
         # Get all locations
-        locations_response = supabase.table('locations').select('*').execute()
+        locations = load_locations(supabase)
         
-        if not locations_response.data:
+        if not locations:
             return jsonify({'data': []}), 200
         
         # Get all teams for joining
-        teams_response = supabase.table('teams').select('id, name, color').execute()
-        teams_dict = {team['id']: team for team in teams_response.data} if teams_response.data else {}
+        teams_dict = load_teams_by_id(supabase)
         
         # Process each location and add team information
-        result_data = []
-        for location in locations_response.data:
-            location_obj = {
-                'id': location.get('id'),
-                'name': location.get('name'),
-                'image': location.get('image'),
-                'latitude': location.get('latitude'),  # Fixed typo from your spec
-                'longitude': location.get('longitude'),
-                'owner_team': location.get('owner_team'),
-                'owner_count': location.get('owner_count'),
-                'owned_since': location.get('owned_since'),
-                'strongest_owner_id': location.get('strongest_owner_id')
-            }
-            
-            # Calculate can_join based on owned_since timestamp
-            can_join = False
-            owned_since = location.get('owned_since')
-            if owned_since:
-                try:
-                    # Parse the owned_since timestamp (assuming it's in ISO format)
-                    owned_since_dt = datetime.fromisoformat(owned_since.replace('Z', '+00:00'))
-                    # Convert to server's local timezone (UTC in this case)
-                    if owned_since_dt.tzinfo is None:
-                        owned_since_dt = owned_since_dt.replace(tzinfo=timezone.utc)
-                    
-                    # Get current server time
-                    current_time = datetime.now(timezone.utc)
-                    
-                    # Calculate time difference in seconds
-                    time_diff = (current_time - owned_since_dt).total_seconds()
-                    
-                    # Location can be joined if more than CAN_JOIN_PERIOD seconds have passed
-                    can_join = time_diff > CAN_JOIN_PERIOD
-                except (ValueError, TypeError):
-                    # If timestamp parsing fails, default to False
-                    can_join = False
-            
-            location_obj['can_join'] = can_join
-            
-            # Add team information if owner_team exists
-            owner_team_id = location.get('owner_team')
-            if owner_team_id and owner_team_id in teams_dict:
-                team_info = teams_dict[owner_team_id]
-                location_obj['owner_team_color'] = team_info.get('color')
-                location_obj['owner_team_name'] = team_info.get('name')
-            else:
-                # Default values if no owner team or team not found
-                location_obj['owner_team_color'] = None
-                location_obj['owner_team_name'] = None
-            
-            result_data.append(location_obj)
+        result_data = [build_location_object(location, teams_dict) for location in locations]
         
         return jsonify({'data': result_data}), 200
         
@@ -86,19 +178,23 @@ def get_locations():
         return jsonify({'error': str(e)}), 500
 
 @locations_bp.route('/<int:location_id>', methods=['GET'])
+@sharding.routed_by_location(sharding.location_from_path)
 def get_location(location_id):
     """Get specific location by ID"""
+    supabase = get_supabase_client()
     if not supabase:
         return jsonify({'error': 'Database not configured'}), 500
     
     try:
-        response = supabase.table('locations').select('*').eq('id', location_id).execute()
-        
-        if not response.data:
-            return jsonify({'error': 'Location not found'}), 404
+        location = snapshot.get_location(location_id)
+        if location is None:
+            location = row_cache.get_location(location_id)
+            
+            if not location:
+                return jsonify({'error': 'Location not found'}), 404
             
         return jsonify({
-            'location': response.data[0]
+            'location': location
         })
         
     except Exception as e:
@@ -1,16 +1,22 @@
 import os
 import jwt
-from functools import wraps
+from functools import lru_cache, wraps
 from flask import Blueprint, request, jsonify, g
 from database import get_supabase_client
+from idempotency import idempotent
+import row_cache
+import snapshot
+import stats_buffer
 
 profile_bp = Blueprint('profile', __name__)
 
-# Get Supabase client
-supabase = get_supabase_client()
+DEFAULT_PFP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'default_pfp.txt')
 
-with open("./routes/default_pfp.txt", "r") as file:
-    DEFAULT_PFP = file.read().strip()
+@lru_cache(maxsize=None)
+def get_default_pfp():
+    """Load the default profile picture once, relative to this package"""
+    with open(DEFAULT_PFP_PATH, "r") as file:
+        return file.read().strip()
 
 def require_auth(f):
     """Decorator to require authentication for endpoints"""
@@ -53,8 +59,10 @@ def require_auth(f):
 
 @profile_bp.route('/set_picture', methods=['POST'])
 @require_auth
+@idempotent
 def set_picture():
     """Set the profile picture of the authenticated user"""
+    supabase = get_supabase_client()
     if not supabase:
         return jsonify({'error': 'Database not configured'}), 500
     
@@ -86,6 +94,7 @@ def set_picture():
 @require_auth
 def remove_picture():
     """Remove the profile picture of the authenticated user"""
+    supabase = get_supabase_client()
     if not supabase:
         return jsonify({'error': 'Database not configured'}), 500
     
@@ -94,7 +103,7 @@ def remove_picture():
         
         # Set profile picture to null/default
         response = supabase.table('users').update({
-            'image': DEFAULT_PFP
+            'image': get_default_pfp()
         }).eq('id', user_id).execute()
         
         if not response.data:
@@ -109,6 +118,7 @@ def remove_picture():
 @require_auth
 def set_team():
     """Set the team of the authenticated user"""
+    supabase = get_supabase_client()
     if not supabase:
         return jsonify({'error': 'Database not configured'}), 500
     
@@ -133,15 +143,52 @@ def set_team():
         
         if not response.data:
             return jsonify({'error': 'Failed to update team'}), 500
+        row_cache.users.patch(user_id, {'team': team})
         
         return jsonify({}), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def load_profile(supabase, user_id, include_image=True):
+    """Public profile of a user with the names of the locations they defend, or None if not found"""
+    if include_image:
+        # The row cache leaves out the base64 image, so read the row directly (excluding password_hash for security)
+        user_response = supabase.table('users').select(f"{row_cache.USER_FIELDS}, image").eq('id', user_id).execute()
+        user = user_response.data[0] if user_response.data else None
+    else:
+        user = row_cache.get_user(user_id)
+    
+    if not user:
+        return None
+    
+    # Include stat deltas that are still waiting in the write-behind buffer
+    user = stats_buffer.apply_pending(user_id, user)
+    
+    # Get locations where this user is the strongest owner
+    locations_response = supabase.table('locations').select(
+        'name'
+    ).eq('strongest_owner_id', user_id).execute()
+    
+    # Extract location names into an array
+    defending_locations = []
+    if locations_response.data:
+        defending_locations = [location.get('name') for location in locations_response.data if location.get('name')]
+    
+    return {
+        'username': user.get('username'),
+        'team': user.get('team'),
+        'image': user.get('image'),
+        'strength': user.get('strength'),
+        'wins': user.get('wins'),
+        'losses': user.get('losses'),
+        'defending': defending_locations
+    }
+
 @profile_bp.route('/get_profile', methods=['POST'])
 def get_profile():
     """Get the profile of a user by ID"""
+    supabase = get_supabase_client()
     if not supabase:
         return jsonify({'error': 'Database not configured'}), 500
     
@@ -157,36 +204,96 @@ def get_profile():
         if not isinstance(user_id, int):
             return jsonify({'error': 'User ID must be an integer'}), 400
         
-        # Get user profile from database (excluding password_hash for security)
-        response = supabase.table('users').select(
-            'username, team, image, strength, wins, losses'
-        ).eq('id', user_id).execute()
+        profile = load_profile(supabase, user_id)
         
-        if not response.data:
+        if profile is None:
             return jsonify({'error': 'User not found'}), 404
         
-        user = response.data[0]
+        return jsonify(profile), 200
         
-        # Get locations where this user is the strongest owner
-        locations_response = supabase.table('locations').select(
-            'name'
-        ).eq('strongest_owner_id', user_id).execute()
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@profile_bp.route('/get_user_stats', methods=['GET'])
+@require_auth
+def get_user_stats():
+    """Get battle and location statistics of the authenticated user"""
+    supabase = get_supabase_client()
+    if not supabase:
+        return jsonify({'error': 'Database not configured'}), 500
+    
+    try:
+        user_id = g.user_id
         
-        # Extract location names into an array
-        defending_locations = []
-        if locations_response.data:
-            defending_locations = [location.get('name') for location in locations_response.data if location.get('name')]
+        # Aggregates are kept up to date by battles and ownership changes, so this is a single row lookup
+        user = row_cache.get_user(user_id)
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        user = stats_buffer.apply_pending(user_id, user)
+        wins = user.get('wins') or 0
+        losses = user.get('losses') or 0
+        battles_fought = wins + losses
         
         return jsonify({
-            'username': user.get('username'),
-            'team': user.get('team'),
-            'image': user.get('image'),
             'strength': user.get('strength'),
-            'wins': user.get('wins'),
-            'losses': user.get('losses'),
-            'defending': defending_locations
+            'battles_won': wins,
+            'battles_lost': losses,
+            'battles_fought': battles_fought,
+            'win_rate': round(wins / battles_fought * 100) if battles_fought else 0,
+            'locations_owned': user.get('locations_owned') or 0,
+            'locations_defending': user.get('locations_defending') or 0,
+            'locations_conquered': user.get('locations_conquered') or 0
         }), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@profile_bp.route('/get_owned_locations', methods=['GET'])
+@require_auth
+def get_owned_locations():
+    """Get the locations the authenticated user is an owner of"""
+    supabase = get_supabase_client()
+    if not supabase:
+        return jsonify({'error': 'Database not configured'}), 500
+    
+    try:
+        user_id = g.user_id
+        
+        # Indexed lookup on location_owners.user_id
+        owned_response = supabase.table('location_owners').select('location_id').eq('user_id', user_id).execute()
+        location_ids = [row['location_id'] for row in owned_response.data or []]
+        
+        # Rows missing from the world state are read in one query per table, not one per location
+        locations_by_id = {location_id: snapshot.get_location(location_id) for location_id in location_ids}
+        missing_location_ids = [location_id for location_id, location in locations_by_id.items() if location is None]
+        if missing_location_ids:
+            locations_by_id.update(row_cache.get_locations(missing_location_ids))
+        
+        teams = snapshot.get_teams() or {}
+        missing_team_ids = {location.get('owner_team') for location in locations_by_id.values() if location} - set(teams) - {None}
+        if missing_team_ids:
+            teams = {**teams, **row_cache.get_teams(missing_team_ids)}
+        
+        locations = []
+        for location_id in location_ids:
+            location = locations_by_id.get(location_id)
+            if not location:
+                continue
+            
+            owner_team_id = location.get('owner_team')
+            team = teams.get(owner_team_id) if owner_team_id else None
+            locations.append({
+                'id': location_id,
+                'name': location.get('name'),
+                'owner_team': owner_team_id,
+                'owner_team_name': team.get('name') if team else None,
+                'owner_team_color': team.get('color') if team else None,
+                'owner_count': location.get('owner_count'),
+                'strongest_owner_id': location.get('strongest_owner_id')
+            })
+        
+        return jsonify({'locations': locations}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -0,0 +1,39 @@
+from flask import Blueprint, jsonify
+from database import get_supabase_client
+import sharding
+import snapshot
+
+shards_bp = Blueprint('shards', __name__)
+
+def local_summary():
+    """Ownership summary of the locations served by this shard"""
+    locations = snapshot.get_locations()
+    if locations is None:
+        supabase = get_supabase_client()
+        if not supabase:
+            return {'shard': sharding.SHARD_ID, 'teams': {}}
+        response = supabase.table('locations').select(
+            'id, owner_team, owner_count'
+        ).not_.is_('owner_team', 'null').execute()
+        locations = response.data or []
+    
+    return sharding.summarize(locations)
+
+@shards_bp.route('/summary', methods=['GET'])
+def get_summary():
+    """Get per-team ownership totals for this shard's locations"""
+    try:
+        return jsonify(local_summary()), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@shards_bp.route('/owner/<int:location_id>', methods=['GET'])
+def get_owner(location_id):
+    """Get the shard that owns a location"""
+    owner = sharding.owner_of(location_id)
+    return jsonify({
+        'location_id': location_id,
+        'shard': owner,
+        'url': sharding.NODES.get(owner)
+    }), 200
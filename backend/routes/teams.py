@@ -1,21 +1,29 @@
+import math
+from datetime import datetime, timezone
 from flask import Blueprint, request, jsonify
 from database import get_supabase_client
+import points_history
+import row_cache
+import scoring
+import sharding
+from routes.shards import local_summary
 
 teams_bp = Blueprint('teams', __name__)
 
-# Get Supabase client
-supabase = get_supabase_client()
+# Constants
+DEFAULT_HISTORY_SPAN = 24 * 3600  # Seconds of history returned when ?from= is not given
 
 @teams_bp.route('/get_teams', methods=['GET'])
 def get_teams():
     """Get all teams with member counts"""
+    supabase = get_supabase_client()
     if not supabase:
         return jsonify({'error': 'Database not configured'}), 500
     
     try:
         # Get all teams
-        teams_response = supabase.table('teams').select('id, name, color, points').execute()
-        teams = teams_response.data
+        teams_response = supabase.table('teams').select('id, name, color, points, points_rate, points_since').execute()
+        teams = [scoring.with_current_points(team) for team in teams_response.data]
         
         # Get all users to count members per team
         users_response = supabase.table('users').select('team').execute()
@@ -28,14 +36,21 @@ def get_teams():
             if team_id is not None:
                 team_member_counts[team_id] = team_member_counts.get(team_id, 0) + 1
         
-        # Add member count to each team
+        # Count owned locations per team from every shard's cached summary
+        ownership, missing_shards = sharding.aggregate_summaries(local_summary())
+        
+        # Add member and location counts to each team
         for team in teams:
             team_id = team['id']
             team['members'] = team_member_counts.get(team_id, 0)
+            team['locations_owned'] = ownership.get(team_id, {}).get('locations', 0)
         
         print(teams)
         return jsonify({
-            'data': teams
+            'data': teams,
+            # locations_owned leaves out the locations of shards whose summary is unavailable
+            'partial': bool(missing_shards),
+            'missing_shards': missing_shards
         })
         
     except Exception as e:
@@ -44,6 +59,7 @@ def get_teams():
 @teams_bp.route('/get_team', methods=['POST'])
 def get_team():
     """Get a specific team by ID"""
+    supabase = get_supabase_client()
     if not supabase:
         return jsonify({'error': 'Database not configured'}), 500
     
@@ -59,14 +75,76 @@ def get_team():
         if not isinstance(team_id, int):
             return jsonify({'error': 'Team ID must be an integer'}), 400
         
-        # Query the specific team
-        response = supabase.table('teams').select('id, name, color, points').eq('id', team_id).execute()
+        # Query the specific team through the row cache
+        team = row_cache.get_team(team_id)
         
-        if not response.data:
+        if not team:
             return jsonify({'error': 'Team not found'}), 404
             
-        # Return the single team object
-        return jsonify(response.data[0])
+        # Return the single team object with its current accrued points
+        return jsonify(scoring.with_current_points(team))
         
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500
+
+def parse_time(value):
+    """Unix timestamp from epoch seconds or an ISO 8601 string, None if invalid"""
+    try:
+        timestamp = float(value)
+    except ValueError:
+        try:
+            parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+
+    # Reject nan, inf and values outside the range datetime can represent
+    if not math.isfinite(timestamp):
+        return None
+    try:
+        datetime.fromtimestamp(timestamp, tz=timezone.utc)
+    except (OverflowError, ValueError, OSError):
+        return None
+    return timestamp
+
+@teams_bp.route('/<int:team_id>/history', methods=['GET'])
+def get_team_history(team_id):
+    """Get a team's points over time at 1m, 10m or 1h resolution"""
+    try:
+        end = parse_time(request.args['to']) if 'to' in request.args else datetime.now(timezone.utc).timestamp()
+        start = parse_time(request.args['from']) if 'from' in request.args else (end or 0) - DEFAULT_HISTORY_SPAN
+        if start is None or end is None:
+            return jsonify({'error': 'from and to must be unix timestamps or ISO 8601 times'}), 400
+        if start > end:
+            return jsonify({'error': 'from must not be after to'}), 400
+        
+        resolution = request.args.get('resolution') or points_history.pick_resolution(start, end)
+        if resolution not in points_history.RESOLUTIONS:
+            return jsonify({'error': f"resolution must be one of {', '.join(points_history.RESOLUTIONS)}"}), 400
+        
+        bucket_seconds, capacity = points_history.RESOLUTIONS[resolution]
+        if (end - start) / bucket_seconds > points_history.MAX_POINTS:
+            if resolution == points_history.COARSEST_RESOLUTION:
+                retention_days = bucket_seconds * capacity // 86400
+                return jsonify({'error': f"Range exceeds the {retention_days} days of history that are kept"}), 400
+            return jsonify({'error': f"Range is too long for {resolution} resolution, use a coarser one"}), 400
+        
+        if not row_cache.get_team(team_id):
+            return jsonify({'error': 'Team not found'}), 404
+        
+        samples = points_history.query(team_id, start, end, resolution)
+        return jsonify({
+            'team_id': team_id,
+            'resolution': resolution,
+            'from': datetime.fromtimestamp(start, tz=timezone.utc).isoformat(),
+            'to': datetime.fromtimestamp(end, tz=timezone.utc).isoformat(),
+            'data': [
+                {'timestamp': datetime.fromtimestamp(bucket_start, tz=timezone.utc).isoformat(), 'points': points}
+                for bucket_start, points in samples
+            ]
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -0,0 +1,212 @@
+"""
+Read-through row cache for users, teams and locations
+
+Each entity has a bounded LRU cache whose entries expire after a TTL.
+Lookups go through get_user/get_team/get_location, writes made through the
+app patch or evict entries, and changes published by other workers on the
+invalidation bus are applied once start() has been called. A patch or
+evict also voids read-through loads of the same row that are still in
+progress, so a row read before a write can never be cached after it. Hit ratio and
+eviction counts are reported by stats().
+"""
+import threading
+import time
+from collections import OrderedDict
+from database import get_supabase_client
+import invalidation
+
+# Constants
+# Users are cached without the base64 image so an entry stays small; read image directly when needed
+USER_FIELDS = 'id, username, team, strength, wins, losses, last_battle, locations_owned, locations_defending, locations_conquered'
+TEAM_FIELDS = 'id, name, color, points, points_rate, points_since'
+LOCATION_FIELDS = '*'
+
+class RowCache:
+    """Bounded LRU cache of rows keyed by id, entries expire after ttl seconds"""
+
+    def __init__(self, name, maxsize, ttl):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._rows = OrderedDict()  # key -> (expires_at, row)
+        self._loads = {}  # key -> tokens of loads in progress whose result may still be cached
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+    def get(self, key):
+        """Cached row copy or None"""
+        with self._lock:
+            entry = self._rows.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            if entry[0] < time.monotonic():
+                del self._rows[key]
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return None
+            self._rows.move_to_end(key)
+            self._stats['hits'] += 1
+            return dict(entry[1])
+
+    def put(self, key, row):
+        with self._lock:
+            self._rows[key] = (time.monotonic() + self.ttl, dict(row))
+            self._rows.move_to_end(key)
+            while len(self._rows) > self.maxsize:
+                self._rows.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def patch(self, key, fields):
+        """Apply written fields to a cached row, if present"""
+        with self._lock:
+            self._loads.pop(key, None)
+            entry = self._rows.get(key)
+            if entry is not None:
+                self._rows[key] = (entry[0], {**entry[1], **fields})
+
+    def evict(self, key):
+        with self._lock:
+            self._loads.pop(key, None)
+            if self._rows.pop(key, None) is not None:
+                self._stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._rows.clear()
+            self._loads.clear()
+
+    def _begin_load(self, keys):
+        token = object()
+        with self._lock:
+            for key in keys:
+                self._loads.setdefault(key, set()).add(token)
+        return token
+
+    def _end_load(self, keys, token):
+        """Keys whose load is still current, i.e. no write to them was applied while they were being read"""
+        current = set()
+        with self._lock:
+            for key in keys:
+                tokens = self._loads.get(key)
+                if tokens is not None and token in tokens:
+                    current.add(key)
+                    tokens.discard(token)
+                    if not tokens:
+                        del self._loads[key]
+        return current
+
+    def get_or_load(self, key, loader):
+        """Read-through lookup, loader() returns the row or None (misses are not cached)"""
+        row = self.get(key)
+        if row is not None:
+            return row
+
+        token = self._begin_load([key])
+        try:
+            row = loader()
+        finally:
+            current = self._end_load([key], token)
+
+        if row is None:
+            return None
+        if key in current:
+            self.put(key, row)
+        return dict(row)
+
+    def get_many_or_load(self, keys, loader):
+        """Read-through lookup of several rows, loader(missing keys) returns {key: row} for those found in one query"""
+        rows = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            row = self.get(key)
+            if row is None:
+                missing.append(key)
+            else:
+                rows[key] = row
+        if not missing:
+            return rows
+
+        token = self._begin_load(missing)
+        try:
+            loaded = loader(missing)
+        finally:
+            current = self._end_load(missing, token)
+
+        for key, row in loaded.items():
+            if key in current:
+                self.put(key, row)
+            rows[key] = dict(row)
+        return rows
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return dict(
+                self._stats,
+                size=len(self._rows),
+                maxsize=self.maxsize,
+                hit_ratio=round(self._stats['hits'] / lookups, 4) if lookups else None
+            )
+
+users = RowCache('users', maxsize=4096, ttl=60)
+teams = RowCache('teams', maxsize=256, ttl=60)
+locations = RowCache('locations', maxsize=2048, ttl=30)
+
+def _select_one(table, fields, row_id):
+    supabase = get_supabase_client()
+    if not supabase:
+        return None
+    response = supabase.table(table).select(fields).eq('id', row_id).execute()
+    return response.data[0] if response.data else None
+
+def _select_many(table, fields, row_ids):
+    supabase = get_supabase_client()
+    if not supabase:
+        return {}
+    response = supabase.table(table).select(fields).in_('id', list(row_ids)).execute()
+    return {row['id']: row for row in response.data or []}
+
+def get_user(user_id):
+    """Users row (without password_hash) by id, or None if not found"""
+    return users.get_or_load(user_id, lambda: _select_one('users', USER_FIELDS, user_id))
+
+def get_team(team_id):
+    """Teams row by id, or None if not found"""
+    return teams.get_or_load(team_id, lambda: _select_one('teams', TEAM_FIELDS, team_id))
+
+def get_location(location_id):
+    """Locations row by id, or None if not found"""
+    return locations.get_or_load(location_id, lambda: _select_one('locations', LOCATION_FIELDS, location_id))
+
+def get_teams(team_ids):
+    """Teams rows keyed by id for several ids (unknown ids are left out), cache misses are read in one query"""
+    return teams.get_many_or_load(team_ids, lambda missing: _select_many('teams', TEAM_FIELDS, missing))
+
+def get_locations(location_ids):
+    """Locations rows keyed by id for several ids (unknown ids are left out), cache misses are read in one query"""
+    return locations.get_many_or_load(location_ids, lambda missing: _select_many('locations', LOCATION_FIELDS, missing))
+
+def stats():
+    """Per-entity cache counters for health reporting"""
+    return {cache.name: cache.stats() for cache in (users, teams, locations)}
+
+def _on_change(cache):
+    def handler(row_id, fields):
+        if fields:
+            cache.patch(row_id, fields)
+        else:
+            cache.evict(row_id)
+    return handler
+
+_started = False
+
+def start():
+    """Apply changes published by other workers to the caches"""
+    global _started
+    if _started:
+        return
+    _started = True
+    invalidation.subscribe('user', _on_change(users))
+    invalidation.subscribe('team', _on_change(teams))
+    invalidation.subscribe('location', _on_change(locations))
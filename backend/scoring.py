@@ -0,0 +1,116 @@
+"""
+Lazy time-weighted point accrual for teams
+
+Each team stores a base score (`points`), the rate it currently earns points
+at (`points_rate`, the sum of owner_count over the locations it owns) and the
+time that base was last materialized (`points_since`). A team earns
+`points_rate` points every POINTS_PERIOD seconds, so the current score is
+computed on read in O(1) and only written when ownership changes, by a
+single atomic SQL function (materialize_team_points).
+"""
+import math
+from datetime import datetime, timezone
+from database import get_supabase_client
+import invalidation
+import points_history
+import row_cache
+import snapshot
+
+# Constants
+POINTS_PERIOD = 600  # Seconds to earn owner_count points for one location (the old 10-minute award cycle)
+
+def _parse_timestamp(value):
+    """Parse a Supabase timestamp into an aware UTC datetime"""
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        try:
+            parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except (ValueError, TypeError):
+            return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+def accrued_points(team, now=None):
+    """Exact (fractional) score of a team row with points, points_rate and points_since"""
+    base = team.get('points') or 0
+    rate = team.get('points_rate') or 0
+    since = _parse_timestamp(team.get('points_since'))
+    if not rate or not since:
+        return base
+
+    now = now or datetime.now(timezone.utc)
+    elapsed = max(0.0, (now - since).total_seconds())
+    return base + rate * elapsed / POINTS_PERIOD
+
+def current_points(team, now=None):
+    """Whole-point score of a team as shown to clients"""
+    return int(math.floor(accrued_points(team, now)))
+
+def with_current_points(team, now=None):
+    """Replace the stored base score of a team row with its current score and drop accrual fields"""
+    result = dict(team)
+    result['points'] = current_points(team, now)
+    result.pop('points_rate', None)
+    result.pop('points_since', None)
+    return result
+
+def apply_team_update(team_id, update_data):
+    """Propagate a committed points/points_rate/points_since change to caches, other workers and the history"""
+    row_cache.teams.patch(team_id, update_data)
+    snapshot.patch_team(team_id, update_data)
+    invalidation.publish('team', team_id, update_data)
+    points_history.record(team_id, update_data['points'])
+
+def materialize_team(team_id, rate_delta=0, new_rate=None):
+    """Fold accrued points into a team's base score and change its accrual rate in one atomic statement"""
+    supabase = get_supabase_client()
+    if not supabase or team_id is None:
+        return None
+
+    # The database computes the accrued points, carries the fractional point over and sets the new rate
+    # under a row lock, so concurrent workers never lose each other's points
+    response = supabase.rpc('materialize_team_points', {
+        'p_team_id': team_id,
+        'p_rate_delta': rate_delta,
+        'p_new_rate': new_rate
+    }).execute()
+    if not response.data:
+        return None
+
+    team = response.data[0]
+    update_data = {
+        'points': team['points'],
+        'points_rate': team['points_rate'],
+        'points_since': team['points_since']
+    }
+    apply_team_update(team_id, update_data)
+    return update_data
+
+def reconcile_rates():
+    """Recompute every team's accrual rate from the locations table (run once at startup)"""
+    supabase = get_supabase_client()
+    if not supabase:
+        return {}
+
+    locations_response = supabase.table('locations').select(
+        'owner_team, owner_count'
+    ).not_.is_('owner_team', 'null').execute()
+
+    rates = {}
+    for location in locations_response.data or []:
+        owner_team = location.get('owner_team')
+        owner_count = location.get('owner_count') or 0
+        if owner_team and owner_count > 0:
+            rates[owner_team] = rates.get(owner_team, 0) + owner_count
+
+    teams_response = supabase.table('teams').select('id, points_rate').execute()
+    for team in teams_response.data or []:
+        rate = rates.get(team['id'], 0)
+        if (team.get('points_rate') or 0) != rate:
+            materialize_team(team['id'], new_rate=rate)
+
+    return rates
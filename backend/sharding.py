@@ -0,0 +1,240 @@
+"""
+Region-sharded game world across backend nodes
+
+Locations are assigned to nodes with consistent hashing on their id, so
+adding or removing a node only moves the locations next to it on the ring.
+Calls that write a location (battle, become_owner) or read one
+(locations/<id>) are forwarded to the node owning it; global views are
+aggregated from per-shard summaries, which each node refreshes from the
+others in the background so requests never wait on another shard.
+
+Configure every node with the same node list, the same secret and its own id:
+    SHARD_NODES=a=http://127.0.0.1:5001,b=http://127.0.0.1:5002
+    SHARD_SECRET=<random string>
+    SHARD_ID=a
+Forwarded requests carry the secret, and a request only counts as forwarded
+(served without routing) when it matches, so clients cannot make a node
+resolve a location it does not own.
+Without SHARD_NODES the node serves every location itself.
+"""
+import bisect
+import hashlib
+import hmac
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+import requests
+from datetime import datetime
+from flask import request, jsonify, Response
+
+# Constants
+VIRTUAL_NODES = 100  # Points per node on the hash ring, evens out the distribution
+FORWARD_TIMEOUT = 5  # Seconds to wait for the owning shard
+FORWARDED_HEADER = 'X-Shard-Forwarded'
+SECRET_HEADER = 'X-Shard-Secret'
+FORWARDED_REQUEST_HEADERS = ('Authorization', 'Content-Type', 'Idempotency-Key')
+FORWARDED_RESPONSE_HEADERS = ('Content-Type', 'Retry-After')
+SUMMARY_REFRESH_INTERVAL = 10  # Seconds between background refreshes of the other shards' summaries
+SUMMARY_MAX_AGE = 60  # Seconds a shard's last summary is used before that shard counts as missing
+
+class HashRing:
+    """Consistent hash ring mapping keys to node ids"""
+
+    def __init__(self, nodes, virtual_nodes=VIRTUAL_NODES):
+        self.nodes = list(nodes)
+        self._ring = sorted(
+            (self._hash(f"{node}#{replica}"), node)
+            for node in self.nodes
+            for replica in range(virtual_nodes)
+        )
+        self._keys = [point for point, _ in self._ring]
+
+    @staticmethod
+    def _hash(value):
+        return int.from_bytes(hashlib.md5(str(value).encode('utf-8')).digest()[:8], 'big')
+
+    def node_for(self, key):
+        """Node owning a key, the first ring point clockwise of its hash"""
+        if not self._ring:
+            return None
+        index = bisect.bisect(self._keys, self._hash(key)) % len(self._ring)
+        return self._ring[index][1]
+
+def parse_nodes(value):
+    """Parse 'id=url,id=url' into an ordered dict of node id -> base url"""
+    nodes = {}
+    for entry in (value or '').split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        node_id, _, url = entry.partition('=')
+        if not url:
+            raise ValueError(f"Invalid SHARD_NODES entry: {entry}")
+        nodes[node_id.strip()] = url.strip().rstrip('/')
+    return nodes
+
+NODES = parse_nodes(os.getenv('SHARD_NODES'))
+SHARD_ID = os.getenv('SHARD_ID') or (next(iter(NODES)) if NODES else 'local')
+RING = HashRing(NODES) if NODES else None
+SHARD_SECRET = os.getenv('SHARD_SECRET', '')
+
+def is_enabled():
+    return RING is not None and len(NODES) > 1
+
+def owner_of(location_id):
+    """Node id owning a location"""
+    if not is_enabled():
+        return SHARD_ID
+    return RING.node_for(f"location:{location_id}")
+
+def is_local(location_id):
+    return owner_of(location_id) == SHARD_ID
+
+def is_forwarded():
+    """Whether the current request was forwarded by another node, proven by the shared SHARD_SECRET"""
+    if FORWARDED_HEADER not in request.headers or not SHARD_SECRET:
+        return False
+    secret = request.headers.get(SECRET_HEADER, '')
+    return hmac.compare_digest(secret.encode('utf-8'), SHARD_SECRET.encode('utf-8'))
+
+def forward(node_id):
+    """Proxy the current request to another node and relay its response"""
+    headers = {name: request.headers[name] for name in FORWARDED_REQUEST_HEADERS if name in request.headers}
+    headers[FORWARDED_HEADER] = SHARD_ID
+    if SHARD_SECRET:
+        headers[SECRET_HEADER] = SHARD_SECRET
+
+    try:
+        response = requests.request(
+            request.method,
+            f"{NODES[node_id]}{request.full_path.rstrip('?')}",
+            headers=headers,
+            data=request.get_data(),
+            timeout=FORWARD_TIMEOUT
+        )
+    except requests.RequestException:
+        return jsonify({'error': f'Shard {node_id} unavailable'}), 502
+
+    relayed_headers = {name: response.headers[name] for name in FORWARDED_RESPONSE_HEADERS if name in response.headers}
+    return Response(response.content, status=response.status_code, headers=relayed_headers)
+
+def location_from_body():
+    data = request.get_json(silent=True) or {}
+    return data.get('id')
+
+def location_from_path():
+    return request.view_args.get('location_id')
+
+def routed_by_location(get_location_id):
+    """Decorator forwarding a request to the shard that owns its location"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            # Requests already forwarded once by another node are always served here to avoid routing loops,
+            # a forwarded header without the shard secret is ignored
+            if is_enabled() and not is_forwarded():
+                location_id = get_location_id()
+                if isinstance(location_id, int) and not is_local(location_id):
+                    return forward(owner_of(location_id))
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+def summarize(locations):
+    """Per-team ownership summary over the locations this shard owns"""
+    teams = {}
+    for location in locations:
+        owner_team = location.get('owner_team')
+        if owner_team is None or not is_local(location.get('id')):
+            continue
+        summary = teams.setdefault(str(owner_team), {'locations': 0, 'owner_count': 0})
+        summary['locations'] += 1
+        summary['owner_count'] += location.get('owner_count') or 0
+    return {'shard': SHARD_ID, 'teams': teams}
+
+def _fetch_summary(node_id):
+    try:
+        response = requests.get(f"{NODES[node_id]}/api/shards/summary", timeout=FORWARD_TIMEOUT)
+        if response.ok:
+            return response.json()
+    except (requests.RequestException, ValueError):
+        pass
+    print(f"[{datetime.now()}] Warning: shard {node_id} summary unavailable")
+    return None
+
+_remote_summaries = {}  # node_id -> (fetched_at, summary) of the other shards
+_summaries_lock = threading.Lock()
+_summary_refresher = None
+
+def refresh_remote_summaries():
+    """Fetch every other shard's summary concurrently and keep the ones that answered"""
+    others = [node_id for node_id in NODES if node_id != SHARD_ID]
+    if not others:
+        return 0
+    with ThreadPoolExecutor(max_workers=len(others)) as executor:
+        fetched = dict(zip(others, executor.map(_fetch_summary, others)))
+
+    now = time.monotonic()
+    with _summaries_lock:
+        for node_id, summary in fetched.items():
+            if summary:
+                _remote_summaries[node_id] = (now, summary)
+    return sum(1 for summary in fetched.values() if summary)
+
+def aggregate_summaries(local_summary):
+    """Merge the local summary with the cached summaries of the other shards, keyed by team id
+
+    Returns (totals, missing) where missing lists the shards without a recent summary,
+    whose locations are therefore not counted.
+    """
+    summaries = [local_summary]
+    missing = []
+    if is_enabled():
+        now = time.monotonic()
+        with _summaries_lock:
+            for node_id in NODES:
+                if node_id == SHARD_ID:
+                    continue
+                cached = _remote_summaries.get(node_id)
+                if cached is None or now - cached[0] > SUMMARY_MAX_AGE:
+                    missing.append(node_id)
+                else:
+                    summaries.append(cached[1])
+
+    totals = {}
+    for summary in summaries:
+        for team_id, team_summary in summary.get('teams', {}).items():
+            total = totals.setdefault(int(team_id), {'locations': 0, 'owner_count': 0})
+            total['locations'] += team_summary.get('locations', 0)
+            total['owner_count'] += team_summary.get('owner_count', 0)
+    return totals, missing
+
+def summary_status():
+    """Age of each other shard's cached summary for health reporting"""
+    now = time.monotonic()
+    with _summaries_lock:
+        return {
+            node_id: round(now - _remote_summaries[node_id][0], 1) if node_id in _remote_summaries else None
+            for node_id in NODES if node_id != SHARD_ID
+        }
+
+def _summary_loop():
+    """Background task keeping the other shards' summaries fresh"""
+    while True:
+        try:
+            refresh_remote_summaries()
+        except Exception as e:
+            print(f"[{datetime.now()}] Error refreshing shard summaries: {str(e)}")
+        time.sleep(SUMMARY_REFRESH_INTERVAL)
+
+def start():
+    """Start refreshing the other shards' summaries (no-op without SHARD_NODES)"""
+    global _summary_refresher
+    if not is_enabled() or _summary_refresher is not None:
+        return
+    if not SHARD_SECRET:
+        print(f"[{datetime.now()}] Warning: SHARD_SECRET is not set, forwarded requests will be routed again")
+    _summary_refresher = threading.Thread(target=_summary_loop, daemon=True)
+    _summary_refresher.start()
@@ -0,0 +1,294 @@
+"""
+Persistent local snapshot of game state for instant warm restarts
+
+Locations (including ownership) and teams are kept in memory and written
+periodically to a compact binary file on local disk. On boot the file is
+memory-mapped and loaded immediately so the first requests are served from
+it, then the in-memory state is reconciled with Supabase in the background.
+
+File layout (little endian):
+    magic b'UVWS' | format u16 | state version u64 | written_at ms u64 | payload length u32 | zlib(JSON payload)
+"""
+import bisect
+import json
+import mmap
+import os
+import random
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime
+from database import get_supabase_client
+import invalidation
+
+# Constants
+SNAPSHOT_PATH = os.getenv('SNAPSHOT_PATH') or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'instance', 'world.snapshot'
+)
+SNAPSHOT_INTERVAL = 30  # Seconds between snapshot writes (only written when state changed)
+RECONCILE_JITTER = 5  # Max random delay in seconds before reconciling, spreads out rolling deploys
+RECONCILE_INTERVAL = 300  # Seconds between full re-reconciles, bounds staleness from lost invalidation events
+RECONCILE_RETRY_MIN = 1  # First retry delay in seconds after a failed reconcile, doubled on each failure
+RECONCILE_RETRY_MAX = 60  # Cap on the retry delay
+SNAPSHOT_MAGIC = b'UVWS'
+SNAPSHOT_FORMAT = 1
+HEADER = struct.Struct('<4sHQQI')
+
+TEAM_FIELDS = 'id, name, color, points, points_rate, points_since'
+
+_lock = threading.Lock()
+_state = {
+    'version': 0,
+    'written_at': None,
+    'source': None,  # 'snapshot' once loaded from disk, 'database' once reconciled
+    'reconciled_at': None,  # Unix ms of the last successful reconcile
+    'locations': None,  # id -> location row
+    'teams': None  # id -> team row
+}
+_dirty = False
+_reconciling = False
+_replay = []  # Patches applied while a reconcile was fetching, replayed on top of its result
+_sorted_ids = (None, [])  # (locations dict, its ids in order), rebuilt only when the dict is replaced
+_started = False
+
+def _encode(version, written_at, locations, teams):
+    payload = zlib.compress(json.dumps({
+        'locations': list(locations.values()),
+        'teams': list(teams.values())
+    }, separators=(',', ':')).encode('utf-8'))
+    return HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_FORMAT, version, written_at, len(payload)) + payload
+
+def _decode(buffer):
+    magic, file_format, version, written_at, length = HEADER.unpack_from(buffer, 0)
+    if magic != SNAPSHOT_MAGIC or file_format != SNAPSHOT_FORMAT:
+        raise ValueError('Unrecognized snapshot format')
+
+    payload = json.loads(zlib.decompress(buffer[HEADER.size:HEADER.size + length]))
+    return {
+        'version': version,
+        'written_at': written_at,
+        'locations': {row['id']: row for row in payload['locations']},
+        'teams': {row['id']: row for row in payload['teams']}
+    }
+
+def load_snapshot(path=SNAPSHOT_PATH):
+    """Memory-map the snapshot file and load it into the in-memory state, returns its version or None"""
+    try:
+        with open(path, 'rb') as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                loaded = _decode(buffer)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"[{datetime.now()}] Ignoring unreadable snapshot {path}: {str(e)}")
+        return None
+
+    with _lock:
+        # Never go back to an older state than one already reconciled from the database
+        if _state['source'] == 'database':
+            return None
+        _state.update(loaded)
+        _state['source'] = 'snapshot'
+
+    print(f"[{datetime.now()}] Loaded snapshot v{loaded['version']} with {len(loaded['locations'])} locations")
+    return loaded['version']
+
+def write_snapshot(path=SNAPSHOT_PATH):
+    """Atomically write the current state to disk, returns the written version or None"""
+    global _dirty
+    with _lock:
+        if _state['locations'] is None or _state['teams'] is None:
+            return None
+        version = _state['version']
+        written_at = int(time.time() * 1000)
+        data = _encode(version, written_at, _state['locations'], _state['teams'])
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+
+    with _lock:
+        _state['written_at'] = written_at
+        # Only clean once the file is in place, and only if nothing changed while it was written
+        if _state['version'] == version:
+            _dirty = False
+    return version
+
+def reconcile():
+    """Replace the in-memory state with fresh rows from the database"""
+    global _dirty, _reconciling
+    supabase = get_supabase_client()
+    if not supabase:
+        return False
+
+    with _lock:
+        _reconciling = True
+        _replay.clear()
+
+    try:
+        locations_response = supabase.table('locations').select('*').execute()
+        teams_response = supabase.table('teams').select(TEAM_FIELDS).execute()
+
+        with _lock:
+            locations = {row['id']: row for row in locations_response.data or []}
+            teams = {row['id']: row for row in teams_response.data or []}
+            for table, row_id, fields in _replay:
+                rows = locations if table == 'locations' else teams
+                if row_id in rows:
+                    rows[row_id] = {**rows[row_id], **fields}
+
+            _state['locations'] = locations
+            _state['teams'] = teams
+            _state['version'] += 1
+            _state['source'] = 'database'
+            _state['reconciled_at'] = int(time.time() * 1000)
+            _dirty = True
+        return True
+    finally:
+        with _lock:
+            _reconciling = False
+            _replay.clear()
+
+def _patch(table, row_id, fields):
+    global _dirty
+    with _lock:
+        rows = _state[table]
+        if rows is not None and row_id in rows:
+            rows[row_id] = {**rows[row_id], **fields}
+            _state['version'] += 1
+            _dirty = True
+        if _reconciling:
+            _replay.append((table, row_id, dict(fields)))
+
+def patch_location(location_id, fields):
+    """Apply a write made through the app to the in-memory location row"""
+    _patch('locations', location_id, fields)
+
+def patch_team(team_id, fields):
+    """Apply a write made through the app to the in-memory team row"""
+    _patch('teams', team_id, fields)
+
+def _refresh(table, row_id, fields_query):
+    """Re-read a single row after another worker changed it without sending the new fields"""
+    supabase = get_supabase_client()
+    if not supabase:
+        return
+    response = supabase.table(table).select(fields_query).eq('id', row_id).execute()
+    if response.data:
+        _patch(table, row_id, response.data[0])
+
+def _on_location_change(location_id, fields):
+    if fields:
+        patch_location(location_id, fields)
+    else:
+        _refresh('locations', location_id, '*')
+
+def _on_team_change(team_id, fields):
+    if fields:
+        patch_team(team_id, fields)
+    else:
+        _refresh('teams', team_id, TEAM_FIELDS)
+
+def _location_ids():
+    """Location ids in order (call with _lock held), patches never add or remove ids so this only changes on reload"""
+    global _sorted_ids
+    locations = _state['locations']
+    if _sorted_ids[0] is not locations:
+        _sorted_ids = (locations, sorted(locations))
+    return _sorted_ids[1]
+
+def get_locations():
+    """All location rows ordered by id, or None if no state is loaded yet"""
+    with _lock:
+        if _state['locations'] is None:
+            return None
+        return [_state['locations'][location_id] for location_id in _location_ids()]
+
+def get_location_page(after_id, limit):
+    """Up to limit location rows with id greater than after_id, ordered by id, or None if no state is loaded yet"""
+    with _lock:
+        if _state['locations'] is None:
+            return None
+        location_ids = _location_ids()
+        first = 0 if after_id is None else bisect.bisect_right(location_ids, after_id)
+        return [_state['locations'][location_id] for location_id in location_ids[first:first + limit]]
+
+def get_location(location_id):
+    """A single location row, or None if unknown or no state is loaded yet"""
+    with _lock:
+        if _state['locations'] is None:
+            return None
+        return _state['locations'].get(location_id)
+
+def get_teams():
+    """Team rows keyed by id, or None if no state is loaded yet"""
+    with _lock:
+        if _state['teams'] is None:
+            return None
+        return dict(_state['teams'])
+
+def status():
+    """Snapshot version and origin for health reporting"""
+    with _lock:
+        return {
+            'version': _state['version'],
+            'source': _state['source'],
+            'written_at': _state['written_at'],
+            'reconciled_at': _state['reconciled_at'],
+            'locations': len(_state['locations']) if _state['locations'] is not None else None
+        }
+
+def _try_reconcile():
+    try:
+        if reconcile():
+            return True
+        print(f"[{datetime.now()}] Snapshot not reconciled: Supabase not configured")
+    except Exception as e:
+        print(f"[{datetime.now()}] Error reconciling snapshot: {str(e)}")
+    return False
+
+def _snapshot_loop():
+    """Background task to reconcile with the database and periodically persist the state"""
+    # Jitter so instances restarted together by a rolling deploy don't all query at once
+    time.sleep(random.uniform(0, RECONCILE_JITTER))
+
+    # Keep retrying with backoff, until then requests are served from the on-disk snapshot
+    delay = RECONCILE_RETRY_MIN
+    while not _try_reconcile():
+        time.sleep(delay)
+        delay = min(delay * 2, RECONCILE_RETRY_MAX)
+    print(f"[{datetime.now()}] Snapshot reconciled with database")
+    last_reconciled = time.monotonic()
+
+    while True:
+        time.sleep(SNAPSHOT_INTERVAL)
+
+        # Re-read everything now and then so events lost by the bus can't leave the state stale for good
+        if time.monotonic() - last_reconciled >= RECONCILE_INTERVAL and _try_reconcile():
+            last_reconciled = time.monotonic()
+
+        try:
+            if _dirty:
+                write_snapshot()
+        except Exception as e:
+            print(f"[{datetime.now()}] Error writing snapshot: {str(e)}")
+
+def start():
+    """Load the on-disk snapshot synchronously, then reconcile and persist in the background"""
+    global _started
+    with _lock:
+        if _started:
+            return
+        _started = True
+
+    # Apply ownership and team changes made by other workers
+    invalidation.subscribe('location', _on_location_change)
+    invalidation.subscribe('team', _on_team_change)
+
+    load_snapshot()
+    threading.Thread(target=_snapshot_loop, daemon=True).start()
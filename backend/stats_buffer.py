@@ -0,0 +1,211 @@
+"""
+Write-behind buffer for player stat updates
+
+Battles record wins/losses/strength/last_battle deltas, and ownership
+changes record the per-user location aggregates, here instead of issuing
+UPDATEs directly. Deltas are accumulated per user in memory and
+flushed in a single batched call every FLUSH_INTERVAL seconds, or sooner
+once MAX_PENDING users have pending changes. Reads of a user row should be
+passed through apply_pending() so they see their not-yet-flushed deltas.
+"""
+import atexit
+import signal
+import sys
+import threading
+from datetime import datetime
+from database import get_supabase_client
+import invalidation
+import row_cache
+
+# Constants
+FLUSH_INTERVAL = 0.25  # Seconds between flushes (upper bound on data lost in a crash)
+MAX_PENDING = 200  # Flush early once this many users have pending deltas
+MIN_STRENGTH = 0
+MAX_STRENGTH = 100
+COUNTERS = ('wins', 'losses', 'strength', 'locations_owned', 'locations_defending', 'locations_conquered')
+
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_flush_requested = threading.Event()
+_pending = {}  # user_id -> delta dict waiting for the next flush
+_in_flight = {}  # user_id -> delta dict currently being written
+_flusher = None
+
+def _empty_delta():
+    delta = {counter: 0 for counter in COUNTERS}
+    delta['last_battle'] = None
+    return delta
+
+def _merge(target, delta):
+    """Add delta into target in place"""
+    for counter in COUNTERS:
+        target[counter] += delta.get(counter, 0)
+    if delta.get('last_battle') and (not target['last_battle'] or delta['last_battle'] > target['last_battle']):
+        target['last_battle'] = delta['last_battle']
+
+def _check_counters(counters):
+    unknown = set(counters) - set(COUNTERS)
+    if unknown:
+        raise ValueError(f"Unknown stat counters: {', '.join(sorted(unknown))}")
+
+def record(user_id, last_battle=None, **counters):
+    """Queue stat deltas (keyword arguments named after COUNTERS) for a user to be written on the next flush"""
+    _check_counters(counters)
+    _ensure_flusher()
+
+    with _lock:
+        if user_id not in _pending:
+            _pending[user_id] = _empty_delta()
+        _merge(_pending[user_id], dict(counters, last_battle=last_battle))
+        pending_count = len(_pending)
+
+    if pending_count >= MAX_PENDING:
+        _flush_requested.set()
+
+def pending_for(user_id):
+    """Get the combined not-yet-committed deltas for a user"""
+    delta = _empty_delta()
+    with _lock:
+        for source in (_in_flight, _pending):
+            if user_id in source:
+                _merge(delta, source[user_id])
+    return delta
+
+def _with_delta(row, delta):
+    """Copy of a users row with a delta added to the stat columns it contains"""
+    merged = dict(row)
+    for counter in COUNTERS:
+        if counter in merged:
+            merged[counter] = (merged.get(counter) or 0) + delta[counter]
+    if 'strength' in merged:
+        merged['strength'] = max(MIN_STRENGTH, min(MAX_STRENGTH, merged['strength']))
+    if delta['last_battle'] and ('last_battle' in merged):
+        merged['last_battle'] = delta['last_battle']
+    return merged
+
+def apply_pending(user_id, row):
+    """Return a copy of a users row with pending deltas applied to its stat columns and last_battle"""
+    if row is None:
+        return row
+    return _with_delta(row, pending_for(user_id))
+
+class Batch:
+    """Deltas for several users that are queued together by commit(), or dropped if never committed"""
+
+    def __init__(self):
+        self._deltas = {}
+
+    def record(self, user_id, last_battle=None, **counters):
+        _check_counters(counters)
+        if user_id not in self._deltas:
+            self._deltas[user_id] = _empty_delta()
+        _merge(self._deltas[user_id], dict(counters, last_battle=last_battle))
+
+    def apply_pending(self, user_id, row):
+        """apply_pending() plus the deltas recorded in this batch so far"""
+        row = apply_pending(user_id, row)
+        if row is None or user_id not in self._deltas:
+            return row
+        return _with_delta(row, self._deltas[user_id])
+
+    def commit(self):
+        """Queue every delta in the batch for the next flush"""
+        for user_id, delta in self._deltas.items():
+            record(user_id, last_battle=delta['last_battle'], **{counter: delta[counter] for counter in COUNTERS})
+        self._deltas = {}
+
+def flush():
+    """Write all pending deltas in one batched call, returns the number of users flushed"""
+    with _flush_lock:
+        with _lock:
+            if not _pending:
+                return 0
+            batch = dict(_pending)
+            _pending.clear()
+            _in_flight.update(batch)
+
+        try:
+            supabase = get_supabase_client()
+            if not supabase:
+                raise RuntimeError('Supabase not configured')
+
+            rows = [dict(delta, id=user_id) for user_id, delta in batch.items()]
+            response = supabase.rpc('apply_user_stat_deltas', {'deltas': rows}).execute()
+
+        except Exception as e:
+            # Put the batch back in front of anything recorded meanwhile so it is retried next flush
+            with _lock:
+                for user_id, delta in batch.items():
+                    if user_id in _pending:
+                        _merge(delta, _pending[user_id])
+                    _pending[user_id] = delta
+                _in_flight.clear()
+            print(f"[{datetime.now()}] Error flushing {len(batch)} stat updates: {str(e)}")
+            return 0
+
+        # The deltas are committed from here on, so nothing below may put them back
+        with _lock:
+            try:
+                # Store the committed values in cached rows as the deltas leave the in-flight set.
+                # They are absolute, so a row cached from a read after the commit is not counted twice,
+                # and patching voids loads still in progress that may have read before it
+                written = {row['id']: row for row in response.data or []}
+                for user_id in batch:
+                    if user_id in written:
+                        row_cache.users.patch(user_id, {column: value for column, value in written[user_id].items() if column != 'id'})
+                    else:
+                        row_cache.users.evict(user_id)
+            except Exception as e:
+                for user_id in batch:
+                    row_cache.users.evict(user_id)
+                print(f"[{datetime.now()}] Unexpected apply_user_stat_deltas response, evicted {len(batch)} users: {str(e)}")
+            finally:
+                _in_flight.clear()
+
+        # Other workers holding these users must re-read them
+        for user_id in batch:
+            invalidation.publish('user', user_id)
+        return len(batch)
+
+def _flush_loop():
+    """Background loop flushing pending deltas every FLUSH_INTERVAL seconds"""
+    while True:
+        _flush_requested.wait(FLUSH_INTERVAL)
+        _flush_requested.clear()
+        try:
+            flush()
+        except Exception as e:
+            print(f"[{datetime.now()}] Error in stat flusher: {str(e)}")
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is not None:
+        return
+    with _lock:
+        if _flusher is not None:
+            return
+        _flusher = threading.Thread(target=_flush_loop, daemon=True)
+        _flusher.start()
+        atexit.register(flush)
+
+def _handle_sigterm(previous_handler):
+    def handler(signum, frame):
+        # atexit hooks don't run when SIGTERM kills the process, so flush first
+        flush()
+        if callable(previous_handler):
+            previous_handler(signum, frame)
+        else:
+            sys.exit(0)
+    return handler
+
+def install_sigterm_handler():
+    """Flush pending deltas when the process is stopped with SIGTERM (Docker, Kubernetes, gunicorn)"""
+    if threading.current_thread() is not threading.main_thread():
+        return False
+    signal.signal(signal.SIGTERM, _handle_sigterm(signal.getsignal(signal.SIGTERM)))
+    return True
+
+def start():
+    """Start the background flusher (also started lazily on the first record) and flush on SIGTERM"""
+    _ensure_flusher()
+    install_sigterm_handler()
@@ -0,0 +1,80 @@
+import os
+import sys
+import pytest
+
+os.environ.setdefault('JWT_SECRET_KEY', 'test-secret')
+
+import database
+import app as app_module
+import battle_queue
+import idempotency
+import points_history
+import row_cache
+import snapshot
+import stats_buffer
+from routes.auth import generate_jwt_token
+from fake_supabase import FakeSupabase
+
+SEED_TABLES = {
+    'teams': [
+        {'id': 1, 'name': 'SCS', 'color': '#FF0000', 'points': 10, 'points_rate': 0, 'points_since': None},
+        {'id': 2, 'name': 'CFA', 'color': '#00FF00', 'points': 20, 'points_rate': 1, 'points_since': None},
+    ],
+    'users': [
+        {'id': 1, 'username': 'alice', 'password_hash': 'x', 'team': 1, 'image': None, 'strength': 10,
+         'wins': 0, 'losses': 0, 'last_battle': None,
+         'locations_owned': 0, 'locations_defending': 0, 'locations_conquered': 0},
+        {'id': 2, 'username': 'bob', 'password_hash': 'x', 'team': 2, 'image': None, 'strength': 20,
+         'wins': 0, 'losses': 0, 'last_battle': None,
+         'locations_owned': 1, 'locations_defending': 1, 'locations_conquered': 1},
+    ],
+    'locations': [
+        {'id': 1, 'name': 'Gates', 'image': 'gates-image', 'latitude': 40.44, 'longitude': -79.94,
+         'owner_team': 2, 'owner_count': 1, 'owned_since': None, 'strongest_owner_id': 2},
+        {'id': 2, 'name': 'Hunt', 'image': 'hunt-image', 'latitude': 40.44, 'longitude': -79.95,
+         'owner_team': None, 'owner_count': 0, 'owned_since': None, 'strongest_owner_id': None},
+    ],
+    'location_owners': [
+        {'location_id': 1, 'user_id': 2},
+    ],
+}
+
+def _reset_state():
+    row_cache.users.clear()
+    row_cache.teams.clear()
+    row_cache.locations.clear()
+    with snapshot._lock:
+        snapshot._state.update({'version': 0, 'written_at': None, 'reconciled_at': None, 'source': None,
+                                'locations': None, 'teams': None})
+    with stats_buffer._lock:
+        stats_buffer._pending.clear()
+        stats_buffer._in_flight.clear()
+    idempotency.store = idempotency.IdempotencyStore()
+    points_history.clear()
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    """Swap get_supabase_client everywhere it was imported for a recording in-memory fake"""
+    fake = FakeSupabase(SEED_TABLES)
+    original = database.get_supabase_client
+    for module in list(sys.modules.values()):
+        if getattr(module, 'get_supabase_client', None) is original:
+            monkeypatch.setattr(module, 'get_supabase_client', lambda: fake)
+
+    # Flush the write-behind buffer only when a test asks for it
+    monkeypatch.setattr(stats_buffer, 'FLUSH_INTERVAL', 3600)
+    monkeypatch.setattr(battle_queue, 'TICK_INTERVAL', 0.01)
+    _reset_state()
+    yield fake
+    _reset_state()
+
+@pytest.fixture
+def client(fake_db):
+    app_module.app.config['TESTING'] = True
+    return app_module.app.test_client()
+
+@pytest.fixture
+def auth_headers():
+    def headers_for(user_id):
+        return {'Authorization': f"Bearer {generate_jwt_token(user_id)}"}
+    return headers_for
@@ -0,0 +1,337 @@
+"""
+In-memory stand-in for the Supabase client that records every query
+
+Supports the subset of the postgrest query builder used by the backend
+(select/insert/update/upsert/delete with eq, neq, gt, gte, lt, lte, in_,
+is_, not_, order and limit) plus the SQL functions documented in the README. Every
+executed query is appended to `calls` so tests can assert query budgets.
+"""
+import copy
+import math
+import threading
+from datetime import datetime, timezone
+
+class Call:
+    """One executed round trip"""
+
+    def __init__(self, table, operation, columns, filters, limit):
+        self.table = table
+        self.operation = operation
+        self.columns = columns
+        self.filters = filters
+        self.limit = limit
+
+    @property
+    def is_read(self):
+        return self.operation == 'select'
+
+    @property
+    def is_full_scan(self):
+        """Reads or writes with no filter and no limit touch every row of the table"""
+        return self.operation in ('select', 'update', 'delete') and not self.filters and self.limit is None
+
+    def __repr__(self):
+        filters = ' '.join(f"{column}{operator}{value!r}" for column, operator, value in self.filters)
+        return f"<{self.operation} {self.table} {filters}{' limit ' + str(self.limit) if self.limit else ''}>"
+
+class Response:
+    def __init__(self, data):
+        self.data = data
+        self.count = None
+
+def _matches(row, filters):
+    for column, operator, value in filters:
+        actual = row.get(column)
+        negate = operator.startswith('not.')
+        operator = operator[4:] if negate else operator
+        if operator == 'eq':
+            result = actual == value
+        elif operator == 'neq':
+            result = actual != value
+        elif operator == 'gt':
+            result = actual is not None and actual > value
+        elif operator == 'gte':
+            result = actual is not None and actual >= value
+        elif operator == 'lt':
+            result = actual is not None and actual < value
+        elif operator == 'lte':
+            result = actual is not None and actual <= value
+        elif operator == 'in':
+            result = actual in value
+        elif operator == 'is':
+            result = actual is None if value in (None, 'null') else actual is value
+        else:
+            raise NotImplementedError(f"Filter {operator} is not supported by the fake client")
+        if result == negate:
+            return False
+    return True
+
+class _Negated:
+    """Builder proxy for `.not_`, negating the next filter"""
+
+    def __init__(self, query):
+        self._query = query
+
+    def __getattr__(self, name):
+        operator = name.rstrip('_')
+
+        def add_filter(column, value):
+            return self._query._filter(column, f"not.{operator}", value)
+        return add_filter
+
+class Query:
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+        self.operation = None
+        self.columns = None
+        self.payload = None
+        self.on_conflict = None
+        self.filters = []
+        self.ordering = None
+        self.row_limit = None
+
+    # Operations
+    def select(self, columns='*', **kwargs):
+        self.operation = self.operation or 'select'
+        self.columns = columns
+        return self
+
+    def insert(self, rows, **kwargs):
+        self.operation = 'insert'
+        self.payload = rows
+        return self
+
+    def upsert(self, rows, on_conflict='id', **kwargs):
+        self.operation = 'upsert'
+        self.payload = rows
+        self.on_conflict = [column.strip() for column in on_conflict.split(',')]
+        return self
+
+    def update(self, values, **kwargs):
+        self.operation = 'update'
+        self.payload = values
+        return self
+
+    def delete(self, **kwargs):
+        self.operation = 'delete'
+        return self
+
+    # Filters and modifiers
+    def _filter(self, column, operator, value):
+        self.filters.append((column, operator, value))
+        return self
+
+    def eq(self, column, value):
+        return self._filter(column, 'eq', value)
+
+    def neq(self, column, value):
+        return self._filter(column, 'neq', value)
+
+    def gt(self, column, value):
+        return self._filter(column, 'gt', value)
+
+    def gte(self, column, value):
+        return self._filter(column, 'gte', value)
+
+    def lt(self, column, value):
+        return self._filter(column, 'lt', value)
+
+    def lte(self, column, value):
+        return self._filter(column, 'lte', value)
+
+    def in_(self, column, values):
+        return self._filter(column, 'in', list(values))
+
+    def is_(self, column, value):
+        return self._filter(column, 'is', value)
+
+    @property
+    def not_(self):
+        return _Negated(self)
+
+    def order(self, column, desc=False, **kwargs):
+        self.ordering = (column, desc)
+        return self
+
+    def limit(self, count, **kwargs):
+        self.row_limit = count
+        return self
+
+    def execute(self):
+        self.client._record(Call(self.table, self.operation, self.columns, list(self.filters), self.row_limit))
+        self.client._maybe_fail(self.table, self.operation)
+        with self.client._lock:
+            return Response(copy.deepcopy(getattr(self, f"_execute_{self.operation}")()))
+
+    # Execution against the in-memory tables
+    def _rows(self):
+        return self.client.tables.setdefault(self.table, [])
+
+    def _matching(self):
+        rows = [row for row in self._rows() if _matches(row, self.filters)]
+        if self.ordering:
+            column, desc = self.ordering
+            rows.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+        if self.row_limit is not None:
+            rows = rows[:self.row_limit]
+        return rows
+
+    def _project(self, row):
+        if not self.columns or self.columns.strip() == '*':
+            return dict(row)
+        return {column.strip(): row.get(column.strip()) for column in self.columns.split(',')}
+
+    def _execute_select(self):
+        return [self._project(row) for row in self._matching()]
+
+    def _insert_row(self, row):
+        row = dict(row)
+        if 'id' not in row and self.table in self.client.serial_tables:
+            row['id'] = max((existing.get('id', 0) for existing in self._rows()), default=0) + 1
+        self._rows().append(row)
+        return row
+
+    def _execute_insert(self):
+        rows = self.payload if isinstance(self.payload, list) else [self.payload]
+        return [self._insert_row(row) for row in rows]
+
+    def _execute_upsert(self):
+        rows = self.payload if isinstance(self.payload, list) else [self.payload]
+        result = []
+        for row in rows:
+            existing = next((candidate for candidate in self._rows()
+                             if all(candidate.get(column) == row.get(column) for column in self.on_conflict)), None)
+            if existing is not None:
+                existing.update(row)
+                result.append(existing)
+            else:
+                result.append(self._insert_row(row))
+        return result
+
+    def _execute_update(self):
+        rows = self._matching()
+        for row in rows:
+            row.update(self.payload)
+        return rows
+
+    def _execute_delete(self):
+        rows = self._matching()
+        deleted = {id(row) for row in rows}
+        self.client.tables[self.table] = [row for row in self._rows() if id(row) not in deleted]
+        return rows
+
+class RpcQuery:
+    def __init__(self, client, name, params):
+        self.client = client
+        self.name = name
+        self.params = params
+
+    def execute(self):
+        self.client._record(Call(self.name, 'rpc', None, [('params', '=', self.params)], None))
+        self.client._maybe_fail(self.name, 'rpc')
+        handler = getattr(self.client, f"_rpc_{self.name}", None)
+        if handler is None:
+            raise NotImplementedError(f"RPC {self.name} is not supported by the fake client")
+        with self.client._lock:
+            return Response(copy.deepcopy(handler(**self.params)))
+
+class FakeSupabase:
+    """Fake client with in-memory tables and a log of executed queries"""
+
+    serial_tables = ('users', 'teams', 'locations')
+
+    def __init__(self, tables=None):
+        self.tables = copy.deepcopy(tables or {})
+        self.calls = []
+        self.failures = set()  # (table or rpc name, operation) pairs that raise when executed
+        self._lock = threading.RLock()
+
+    def table(self, name):
+        return Query(self, name)
+
+    def rpc(self, name, params=None):
+        return RpcQuery(self, name, params or {})
+
+    def _record(self, call):
+        with self._lock:
+            self.calls.append(call)
+
+    def fail(self, table, operation):
+        """Make every later query of this kind raise, as if the database rejected it"""
+        self.failures.add((table, operation))
+
+    def _maybe_fail(self, table, operation):
+        if (table, operation) in self.failures:
+            raise RuntimeError(f"Simulated failure of {operation} on {table}")
+
+    def reset_calls(self):
+        with self._lock:
+            self.calls = []
+
+    def _rpc_apply_user_stat_deltas(self, deltas):
+        users = {user['id']: user for user in self.tables.get('users', [])}
+        for delta in deltas:
+            user = users.get(delta['id'])
+            if user is None:
+                continue
+            for counter in ('wins', 'losses', 'locations_owned', 'locations_defending', 'locations_conquered'):
+                user[counter] = (user.get(counter) or 0) + (delta.get(counter) or 0)
+            user['strength'] = max(0, min(100, (user.get('strength') or 0) + (delta.get('strength') or 0)))
+            if delta.get('last_battle'):
+                user['last_battle'] = delta['last_battle']
+        columns = ('id', 'wins', 'losses', 'strength', 'last_battle', 'locations_owned', 'locations_defending', 'locations_conquered')
+        return [{column: users[delta['id']].get(column) for column in columns} for delta in deltas if delta['id'] in users]
+
+    def _rpc_materialize_team_points(self, p_team_id, p_rate_delta=0, p_new_rate=None):
+        team = next((team for team in self.tables.get('teams', []) if team['id'] == p_team_id), None)
+        if team is None:
+            return []
+        now = datetime.now(timezone.utc)
+        exact = team.get('points') or 0
+        if team.get('points_since') and team.get('points_rate'):
+            since = datetime.fromisoformat(team['points_since'])
+            exact += team['points_rate'] * max(0.0, (now - since).total_seconds()) / 600
+        rate = p_new_rate if p_new_rate is not None else max(0, (team.get('points_rate') or 0) + p_rate_delta)
+        carry = (exact - math.floor(exact)) * 600 / rate if rate > 0 else 0
+        team.update({
+            'points': math.floor(exact),
+            'points_rate': rate,
+            'points_since': datetime.fromtimestamp(now.timestamp() - carry, tz=timezone.utc).isoformat()
+        })
+        return [{column: team[column] for column in ('id', 'points', 'points_rate', 'points_since')}]
+
+    def _rpc_apply_location_tick(self, p_location_id, p_expected, p_fields, p_clear_owners, p_add_owners):
+        location = next((row for row in self.tables.get('locations', []) if row['id'] == p_location_id), None)
+        if location is None or any(location.get(field) != value for field, value in p_expected.items()):
+            return {'conflict': True}
+        old_team, old_count = location.get('owner_team'), location.get('owner_count') or 0
+
+        owners = self.tables.setdefault('location_owners', [])
+        removed = []
+        if p_clear_owners:
+            removed = [row['user_id'] for row in owners if row['location_id'] == p_location_id]
+            owners[:] = [row for row in owners if row['location_id'] != p_location_id]
+        existing = {row['user_id'] for row in owners if row['location_id'] == p_location_id}
+        added = [user_id for user_id in p_add_owners if user_id not in existing]
+        owners.extend({'location_id': p_location_id, 'user_id': user_id} for user_id in added)
+
+        location.update({field: value for field, value in p_fields.items() if field != 'owner_count'})
+        location['owner_count'] = sum(1 for row in owners if row['location_id'] == p_location_id)
+        new_team, new_count = location['owner_team'], location['owner_count']
+
+        if old_team == new_team:
+            rate_changes = [(new_team, new_count - old_count)] if new_team is not None and new_count != old_count else []
+        else:
+            rate_changes = [(team_id, delta) for team_id, delta in ((old_team, -old_count), (new_team, new_count))
+                            if team_id is not None and delta]
+
+        teams = []
+        for team_id, rate_delta in rate_changes:
+            teams.extend(self._rpc_materialize_team_points(team_id, p_rate_delta=rate_delta))
+        return {
+            'location': {field: location.get(field) for field in ('owner_team', 'owner_count', 'strongest_owner_id')},
+            'teams': teams,
+            'removed_owners': removed,
+            'added_owners': added
+        }
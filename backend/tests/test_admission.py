@@ -0,0 +1,72 @@
+"""
+Admission control and load shedding
+"""
+from collections import OrderedDict
+import pytest
+import admission
+
+@pytest.fixture
+def classes(monkeypatch):
+    """Fresh one-slot classes with no queueing, and an empty stale-response cache"""
+    fresh = {
+        name: admission.AdmissionClass(name, limit=1, queue_timeout=0.01, retry_after=admission_class.retry_after)
+        for name, admission_class in admission.classes.items()
+    }
+    monkeypatch.setattr(admission, 'classes', fresh)
+    monkeypatch.setattr(admission, '_last_responses', OrderedDict())
+    return fresh
+
+def test_saturated_class_sheds_with_retry_after(client, classes):
+    assert classes['polling'].acquire()
+
+    response = client.get('/api/teams/get_teams')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == str(classes['polling'].retry_after)
+    assert classes['polling'].stats()['shed'] == 1
+
+def test_saturated_polling_serves_last_response_as_stale(client, classes):
+    fresh = client.get('/api/locations/get_locations')
+    assert fresh.status_code == 200
+    assert admission.SERVED_STALE_HEADER not in fresh.headers
+
+    assert classes['polling'].acquire()
+    response = client.get('/api/locations/get_locations')
+    assert response.status_code == 200
+    assert response.headers[admission.SERVED_STALE_HEADER] == 'true'
+    assert response.json == fresh.json
+    assert classes['polling'].stats()['served_stale'] == 1
+
+    # Stale responses are per URL and format, a different query or an NDJSON request has nothing to fall back on
+    assert client.get('/api/locations/get_locations?limit=1').status_code == 503
+    response = client.get('/api/locations/get_locations', headers={'Accept': 'application/x-ndjson'})
+    assert response.status_code == 503
+
+def test_gameplay_is_admitted_while_polling_is_saturated(client, classes, auth_headers):
+    assert classes['polling'].acquire()
+
+    payload = {'id': 1, 'score': 5, 'result': 'win'}
+    response = client.post('/api/interactions/battle', json=payload, headers=auth_headers(1))
+    assert response.status_code == 200
+    assert classes['gameplay'].stats()['admitted'] == 1
+    assert classes['polling'].stats()['shed'] == 0
+
+def test_slot_is_released_on_teardown(client, classes):
+    for _ in range(3):
+        assert client.get('/api/teams/get_teams').status_code == 200
+    assert client.post('/api/profile/get_profile', json={'id': 2}).status_code == 200
+
+    # Every request got the single slot, so each one gave it back
+    assert classes['polling'].stats()['admitted'] == 3
+    assert classes['polling'].stats()['in_flight'] == 0
+    assert classes['default'].stats()['in_flight'] == 0
+    assert classes['polling'].acquire()
+
+def test_bootstrap_has_its_own_class(client, classes, auth_headers):
+    assert client.get('/api/bootstrap', headers=auth_headers(1)).status_code == 200
+    assert classes['bootstrap'].stats()['admitted'] == 1
+    assert classes['default'].stats()['admitted'] == 0
+
+    assert classes['bootstrap'].acquire()
+    response = client.get('/api/bootstrap', headers=auth_headers(1))
+    assert response.status_code == 503
+    assert 'Retry-After' in response.headers
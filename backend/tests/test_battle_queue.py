@@ -0,0 +1,79 @@
+"""
+Battle tick failure handling
+
+A request must never be told it failed while its battle was (or will be)
+applied: stat deltas are only queued once a tick's writes succeed, and a
+request that times out cancels its job.
+"""
+import threading
+import battle_queue
+import stats_buffer
+
+def test_failed_location_write_queues_no_stat_deltas(client, fake_db, auth_headers):
+    fake_db.fail('apply_location_tick', 'rpc')
+    response = client.post('/api/interactions/become_owner', json={'id': 1, 'result': 'win'}, headers=auth_headers(1))
+    assert response.status_code == 500
+    assert stats_buffer.pending_for(1)['locations_owned'] == 0
+    assert stats_buffer.pending_for(2)['locations_defending'] == 0
+    assert fake_db.tables['location_owners'] == [{'location_id': 1, 'user_id': 2}]
+
+def test_takeover_aggregates_follow_owner_rows(client, fake_db, auth_headers):
+    response = client.post('/api/interactions/become_owner', json={'id': 1, 'result': 'win'}, headers=auth_headers(1))
+    assert response.status_code == 200
+    assert fake_db.tables['location_owners'] == [{'location_id': 1, 'user_id': 1}]
+    assert stats_buffer.pending_for(1)['locations_owned'] == 1
+    assert stats_buffer.pending_for(1)['locations_conquered'] == 1
+    assert stats_buffer.pending_for(2)['locations_owned'] == -1
+    assert stats_buffer.pending_for(2)['locations_defending'] == -1
+
+    # Joining a location the user already owns adds no owner row and no locations_owned
+    stats_buffer.flush()
+    response = client.post('/api/interactions/become_owner', json={'id': 1, 'result': 'win'}, headers=auth_headers(1))
+    assert response.status_code == 200
+    assert stats_buffer.pending_for(1)['locations_owned'] == 0
+
+def test_timed_out_battle_is_cancelled(client, fake_db, auth_headers, monkeypatch):
+    # Hold the tick until the request has given up waiting
+    release = threading.Event()
+    resolve = battle_queue._resolve
+
+    def held_resolve(location_id, jobs):
+        release.wait(5)
+        resolve(location_id, jobs)
+
+    monkeypatch.setattr(battle_queue, '_resolve', held_resolve)
+    monkeypatch.setattr(battle_queue, 'RESULT_TIMEOUT', 0.05)
+
+    response = client.post('/api/interactions/battle', json={'id': 1, 'score': 5, 'result': 'win'}, headers=auth_headers(1))
+    assert response.status_code == 503
+
+    release.set()
+    battle_queue.submit(2, 'battle', 1, {'team': 1, 'strength': 10}, {'result': 'lose'})
+    assert stats_buffer.pending_for(1)['wins'] == 0
+    assert stats_buffer.pending_for(2)['losses'] == 0
+
+def test_tick_on_stale_row_is_redone_from_a_fresh_read(client, fake_db, auth_headers):
+    # Cache location 1 as owned by team 2, then another worker takes it over for team 1
+    assert client.get('/api/locations/1').status_code == 200
+    location = fake_db.tables['locations'][0]
+    location.update({'owner_team': 1, 'owner_count': 1, 'strongest_owner_id': 3})
+    fake_db.tables['teams'][0]['points_rate'] = 1
+    fake_db.tables['teams'][1]['points_rate'] = 0
+
+    # Bob (team 2) takes it back, the rates must move from team 1, not from team 2 a second time
+    fake_db.reset_calls()
+    response = client.post('/api/interactions/become_owner', json={'id': 1, 'result': 'win'}, headers=auth_headers(2))
+    assert response.status_code == 200
+    assert location['owner_team'] == 2
+    assert {team['id']: team['points_rate'] for team in fake_db.tables['teams']} == {1: 0, 2: 1}
+    assert [call.table for call in fake_db.calls].count('apply_location_tick') == 2
+    assert battle_queue.status()['conflicts'] >= 1
+
+def test_rejoining_an_owned_location_changes_no_count_or_rate(client, fake_db, auth_headers):
+    for _ in range(3):
+        response = client.post('/api/interactions/become_owner', json={'id': 1, 'result': 'win'}, headers=auth_headers(2))
+        assert response.status_code == 200
+
+    assert fake_db.tables['locations'][0]['owner_count'] == 1
+    assert fake_db.tables['location_owners'] == [{'location_id': 1, 'user_id': 2}]
+    assert fake_db.tables['teams'][1]['points_rate'] == 1
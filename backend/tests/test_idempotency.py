@@ -0,0 +1,31 @@
+"""
+Idempotency store bounds
+"""
+import idempotency
+
+def test_full_store_evicts_only_completed_keys():
+    store = idempotency.IdempotencyStore(maxsize=2)
+    first, _ = store.begin('first', 'a')
+    second, _ = store.begin('second', 'b')
+
+    # Both keys are in flight, a new key is rejected instead of dropping one of them
+    assert store.begin('third', 'c') == (None, False)
+    entry, is_owner = store.begin('first', 'a')
+    assert entry is first and not is_owner
+
+    # Once the first completes it is the one evicted, the in-flight second stays coalescable
+    store.complete('first', first, (b'{}', 200, 'application/json'))
+    third, is_owner = store.begin('third', 'c')
+    assert third is not None and is_owner
+    entry, is_owner = store.begin('second', 'b')
+    assert entry is second and not is_owner
+    assert store.stats()['rejected_full'] == 1
+
+def test_full_store_returns_503(client, fake_db, auth_headers, monkeypatch):
+    monkeypatch.setattr(idempotency, 'store', idempotency.IdempotencyStore(maxsize=1))
+    idempotency.store.begin(('/api/interactions/battle', 1, 'other'), 'x')
+
+    headers = dict(auth_headers(1), **{idempotency.KEY_HEADER: 'key'})
+    response = client.post('/api/interactions/battle', json={'id': 1, 'score': 5, 'result': 'win'}, headers=headers)
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == str(idempotency.FULL_RETRY_AFTER)
@@ -0,0 +1,22 @@
+"""
+Invalidation event ordering
+"""
+import json
+import invalidation
+
+def _event(origin, version, fields):
+    return json.dumps({'entity': 'location', 'id': 1, 'version': version, 'origin': origin, 'fields': fields}).encode('utf-8')
+
+def test_events_from_other_origins_are_not_compared():
+    bus = invalidation.InvalidationBus(invalidation.LoopbackBackend('test-origins'), worker_id='self')
+    applied = []
+    bus.subscribe('location', lambda location_id, fields: applied.append(fields))
+
+    # A host with a clock far ahead, then a later write from a host numbering its events from 1
+    bus._receive(_event('fast-clock', 10 ** 18, {'owner_team': 1}))
+    bus._receive(_event('other', 1, {'owner_team': 2}))
+    # A reordered, older event from the same origin is dropped
+    bus._receive(_event('fast-clock', 5, {'owner_team': 3}))
+
+    assert applied == [{'owner_team': 1}, {'owner_team': 2}]
+    assert bus.stats()['stale'] == 1
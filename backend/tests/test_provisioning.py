@@ -0,0 +1,39 @@
+"""
+Bulk account provisioning input handling
+"""
+import provisioning
+
+def test_wrongly_typed_rows_fail_individually(client, fake_db, monkeypatch):
+    monkeypatch.setenv('ADMIN_API_KEY', 'secret')
+    users = [
+        {'username': 'carol', 'password': 123},
+        {'username': ['x'], 'password': 'pw'},
+        {'username': 'dave', 'password': 'pw', 'team': 0},
+    ]
+
+    response = client.post('/api/auth/bulk_create_accounts', json={'users': users}, headers={'X-Admin-Key': 'secret'})
+    assert response.status_code == 200
+    assert response.json['created'] == ['dave']
+    assert [failure['index'] for failure in response.json['failed']] == [0, 1]
+
+def test_wrong_admin_key_is_rejected(client, fake_db, monkeypatch):
+    monkeypatch.setenv('ADMIN_API_KEY', 'secret')
+    response = client.post('/api/auth/bulk_create_accounts', json={'users': []}, headers={'X-Admin-Key': 'wrong'})
+    assert response.status_code == 401
+
+def test_csv_team_zero_is_kept(tmp_path):
+    path = tmp_path / 'users.csv'
+    path.write_text('username,password,team\nerin,pw,0\nfrank,pw,\n')
+    assert [user['team'] for user in provisioning._load_users(str(path))] == [0, None]
+
+def test_endpoint_hashes_without_forking(client, fake_db, monkeypatch):
+    monkeypatch.setenv('ADMIN_API_KEY', 'secret')
+
+    def no_processes(*args, **kwargs):
+        raise AssertionError('the server must not fork to hash passwords')
+    monkeypatch.setattr(provisioning, 'ProcessPoolExecutor', no_processes)
+
+    users = [{'username': 'gina', 'password': 'pw'}, {'username': 'hank', 'password': 'pw'}]
+    response = client.post('/api/auth/bulk_create_accounts', json={'users': users}, headers={'X-Admin-Key': 'secret'})
+    assert response.status_code == 200
+    assert sorted(response.json['created']) == ['gina', 'hank']
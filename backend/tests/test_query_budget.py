@@ -0,0 +1,211 @@
+"""
+Query budgets per endpoint
+
+Each endpoint declares how many database round trips and reads a request
+may make and which tables it is allowed to read in full. A test fails when
+a change exceeds the budget or adds a full-table scan, which is how N+1
+patterns and accidental scans get caught.
+"""
+import stats_buffer
+
+# endpoint -> max round trips, max reads, tables it may scan in full
+# These are targets, not a record of current behavior: lower one when an endpoint gets cheaper, never raise one to make a test pass
+QUERY_BUDGETS = {
+    'get_locations': {'round_trips': 2, 'reads': 2, 'scans': {'locations', 'teams'}},
+    'get_locations_from_snapshot': {'round_trips': 0, 'reads': 0, 'scans': set()},
+    'get_locations_page': {'round_trips': 2, 'reads': 2, 'scans': {'teams'}},
+    'get_locations_stream': {'round_trips': 4, 'reads': 4, 'scans': {'teams'}},
+    'get_location': {'round_trips': 1, 'reads': 1, 'scans': set()},
+    'get_teams': {'round_trips': 3, 'reads': 3, 'scans': {'teams', 'users'}},
+    'get_team': {'round_trips': 1, 'reads': 1, 'scans': set()},
+    'get_team_history': {'round_trips': 1, 'reads': 1, 'scans': set()},
+    'get_profile': {'round_trips': 2, 'reads': 2, 'scans': set()},
+    'get_user_stats': {'round_trips': 1, 'reads': 1, 'scans': set()},
+    'get_owned_locations': {'round_trips': 3, 'reads': 3, 'scans': set()},
+    'check_ownership': {'round_trips': 2, 'reads': 2, 'scans': set()},
+    'battle': {'round_trips': 2, 'reads': 2, 'scans': set()},
+    'battle_warm': {'round_trips': 0, 'reads': 0, 'scans': set()},
+    # User and location reads, then one apply_location_tick call writes everything atomically
+    'become_owner_join': {'round_trips': 3, 'reads': 2, 'scans': set()},
+    'become_owner_takeover': {'round_trips': 3, 'reads': 2, 'scans': set()},
+    'stats_flush': {'round_trips': 1, 'reads': 0, 'scans': set()},
+    'bootstrap': {'round_trips': 4, 'reads': 4, 'scans': {'locations', 'teams'}},
+}
+
+def assert_within_budget(fake_db, name):
+    budget = QUERY_BUDGETS[name]
+    calls = list(fake_db.calls)
+    reads = [call for call in calls if call.is_read]
+    scans = {call.table for call in calls if call.is_full_scan}
+
+    assert len(calls) <= budget['round_trips'], f"{name} made {len(calls)} round trips: {calls}"
+    assert len(reads) <= budget['reads'], f"{name} made {len(reads)} reads: {reads}"
+    assert scans <= budget['scans'], f"{name} scanned {sorted(scans - budget['scans'])} in full: {calls}"
+
+def test_get_locations(client, fake_db):
+    response = client.get('/api/locations/get_locations')
+    assert response.status_code == 200
+    assert len(response.json['data']) == 2
+    assert_within_budget(fake_db, 'get_locations')
+
+def test_get_locations_from_snapshot(client, fake_db):
+    import snapshot
+    assert snapshot.reconcile()
+    fake_db.reset_calls()
+
+    response = client.get('/api/locations/get_locations')
+    assert response.status_code == 200
+    assert response.json['data'][0]['owner_team_name'] == 'CFA'
+    assert_within_budget(fake_db, 'get_locations_from_snapshot')
+
+def test_get_locations_page(client, fake_db):
+    response = client.get('/api/locations/get_locations?limit=1')
+    assert response.status_code == 200
+    assert [location['id'] for location in response.json['data']] == [1]
+    assert response.json['next_after_id'] == 1
+    assert_within_budget(fake_db, 'get_locations_page')
+
+    response = client.get('/api/locations/get_locations?after_id=1&limit=1')
+    assert [location['id'] for location in response.json['data']] == [2]
+
+def test_get_locations_stream(client, fake_db, monkeypatch):
+    import json
+    from routes import locations
+    monkeypatch.setattr(locations, 'STREAM_CHUNK_SIZE', 1)
+
+    response = client.get('/api/locations/get_locations?format=ndjson')
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [location['id'] for location in lines] == [1, 2]
+    # Teams, one chunk per location and the empty chunk that ends the stream
+    assert_within_budget(fake_db, 'get_locations_stream')
+
+    # A limit ends the stream early without reading past it
+    fake_db.reset_calls()
+    response = client.get('/api/locations/get_locations?format=ndjson&limit=1')
+    assert [json.loads(line)['id'] for line in response.get_data(as_text=True).splitlines()] == [1]
+    assert len(fake_db.calls) == 2
+
+def test_get_locations_page_from_snapshot(client, fake_db):
+    import snapshot
+    assert snapshot.reconcile()
+    fake_db.reset_calls()
+
+    response = client.get('/api/locations/get_locations?after_id=1&limit=5')
+    assert [location['id'] for location in response.json['data']] == [2]
+    assert response.json['next_after_id'] is None
+    assert fake_db.calls == []
+
+def test_get_location(client, fake_db):
+    assert client.get('/api/locations/1').status_code == 200
+    assert_within_budget(fake_db, 'get_location')
+
+    # The second lookup is served from the row cache
+    fake_db.reset_calls()
+    assert client.get('/api/locations/1').status_code == 200
+    assert fake_db.calls == []
+
+def test_get_teams(client, fake_db):
+    response = client.get('/api/teams/get_teams')
+    assert response.status_code == 200
+    assert {team['id']: team['members'] for team in response.json['data']} == {1: 1, 2: 1}
+    assert_within_budget(fake_db, 'get_teams')
+
+def test_get_team(client, fake_db):
+    response = client.post('/api/teams/get_team', json={'id': 2})
+    assert response.status_code == 200
+    assert response.json['name'] == 'CFA'
+    assert_within_budget(fake_db, 'get_team')
+
+def test_get_team_history(client, fake_db):
+    import time
+    import points_history
+    points_history.record(2, 25, time.time() - 120)
+
+    response = client.get('/api/teams/2/history?resolution=1m')
+    assert response.status_code == 200
+    assert response.json['data'][-1]['points'] == 25
+    assert_within_budget(fake_db, 'get_team_history')
+
+def test_get_team_history_rejects_bad_ranges(client, fake_db):
+    assert client.get('/api/teams/2/history?from=nan').status_code == 400
+    assert client.get('/api/teams/2/history?to=inf').status_code == 400
+    assert client.get('/api/teams/2/history?from=1e300').status_code == 400
+
+    response = client.get('/api/teams/2/history?from=0&resolution=1h')
+    assert response.status_code == 400
+    assert 'days of history' in response.json['error']
+
+def test_get_profile(client, fake_db):
+    response = client.post('/api/profile/get_profile', json={'id': 2})
+    assert response.status_code == 200
+    assert response.json['defending'] == ['Gates']
+    assert_within_budget(fake_db, 'get_profile')
+
+def test_get_user_stats(client, fake_db, auth_headers):
+    response = client.get('/api/profile/get_user_stats', headers=auth_headers(2))
+    assert response.status_code == 200
+    assert response.json['locations_owned'] == 1
+    assert_within_budget(fake_db, 'get_user_stats')
+
+def test_get_owned_locations(client, fake_db, auth_headers):
+    # Several owned locations, so one query per location would go over the budget
+    for location_id in range(3, 8):
+        fake_db.tables['locations'].append({
+            'id': location_id, 'name': f"Hall {location_id}", 'image': None, 'latitude': 40.44, 'longitude': -79.94,
+            'owner_team': 2, 'owner_count': 1, 'owned_since': None, 'strongest_owner_id': 2
+        })
+        fake_db.tables['location_owners'].append({'location_id': location_id, 'user_id': 2})
+
+    response = client.get('/api/profile/get_owned_locations', headers=auth_headers(2))
+    assert response.status_code == 200
+    assert [location['name'] for location in response.json['locations']] == ['Gates'] + [f"Hall {i}" for i in range(3, 8)]
+    assert {location['owner_team_name'] for location in response.json['locations']} == {'CFA'}
+    assert_within_budget(fake_db, 'get_owned_locations')
+
+def test_check_ownership(client, fake_db, auth_headers):
+    response = client.post('/api/interactions/check_ownership', json={'location_id': 1}, headers=auth_headers(2))
+    assert response.status_code == 200
+    assert response.json['is_owner'] is True
+    assert_within_budget(fake_db, 'check_ownership')
+
+def test_battle(client, fake_db, auth_headers):
+    payload = {'id': 1, 'score': 5, 'result': 'win'}
+    response = client.post('/api/interactions/battle', json=payload, headers=auth_headers(1))
+    assert response.status_code == 200
+    assert response.json['message'] == 'win'
+    assert_within_budget(fake_db, 'battle')
+
+    # With the user and location cached a repeat battle makes no reads, stats wait in the buffer
+    fake_db.reset_calls()
+    response = client.post('/api/interactions/battle', json=payload, headers=auth_headers(1))
+    assert response.status_code == 200
+    assert_within_budget(fake_db, 'battle_warm')
+
+    fake_db.reset_calls()
+    assert stats_buffer.flush() == 2
+    assert_within_budget(fake_db, 'stats_flush')
+    users = {user['id']: user for user in fake_db.tables['users']}
+    assert users[1]['wins'] == 2
+    assert users[2]['losses'] == 2
+
+def test_become_owner_join(client, fake_db, auth_headers):
+    fake_db.tables['users'][0]['team'] = 2
+    response = client.post('/api/interactions/become_owner', json={'id': 1, 'result': 'win'}, headers=auth_headers(1))
+    assert response.status_code == 200
+    assert fake_db.tables['locations'][0]['owner_count'] == 2
+    assert_within_budget(fake_db, 'become_owner_join')
+
+def test_become_owner_takeover(client, fake_db, auth_headers):
+    response = client.post('/api/interactions/become_owner', json={'id': 1, 'result': 'win'}, headers=auth_headers(1))
+    assert response.status_code == 200
+    assert fake_db.tables['locations'][0]['owner_team'] == 1
+    assert fake_db.tables['location_owners'] == [{'location_id': 1, 'user_id': 1}]
+    assert_within_budget(fake_db, 'become_owner_takeover')
+
+def test_bootstrap(client, fake_db, auth_headers):
+    response = client.get('/api/bootstrap', headers=auth_headers(1))
+    assert response.status_code == 200
+    assert response.json['team']['id'] == 1
+    assert 'image' not in response.json['locations'][0]
+    assert_within_budget(fake_db, 'bootstrap')
@@ -0,0 +1,24 @@
+"""
+Warm-up and readiness
+"""
+import app as app_module
+import row_cache
+import snapshot
+
+def test_ready_waits_for_warm_up_to_load_hot_data(client, fake_db, monkeypatch):
+    monkeypatch.setitem(app_module.startup_state, 'warmed_up', False)
+    monkeypatch.setitem(app_module.startup_state, 'warm_up_error', None)
+
+    # The database is down, so the warm-up fails and the instance stays not ready
+    fake_db.fail('locations', 'select')
+    response = client.get('/ready')
+    assert response.status_code == 503
+    assert response.json['startup']['warm_up_error']
+    assert snapshot.get_location(1) is None
+
+    fake_db.failures.clear()
+    response = client.get('/ready')
+    assert response.status_code == 200
+    assert response.json['startup']['warmed_up'] is True
+    assert snapshot.get_location(1)['name'] == 'Gates'
+    assert row_cache.teams.get(2)['name'] == 'CFA'
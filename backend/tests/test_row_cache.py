@@ -0,0 +1,40 @@
+"""
+Row cache coherence with concurrent writes
+"""
+import row_cache
+import stats_buffer
+
+def test_load_overlapping_a_write_is_not_cached():
+    cache = row_cache.RowCache('test', maxsize=10, ttl=60)
+
+    def loader():
+        # A write lands while the row is being read
+        cache.patch(1, {'wins': 1})
+        return {'id': 1, 'wins': 0}
+
+    assert cache.get_or_load(1, loader) == {'id': 1, 'wins': 0}
+    assert cache.get(1) is None
+
+def test_batched_load_reads_only_misses_and_skips_overwritten_rows():
+    cache = row_cache.RowCache('test', maxsize=10, ttl=60)
+    cache.put(1, {'id': 1})
+    requested = []
+
+    def loader(keys):
+        requested.append(keys)
+        cache.patch(3, {'wins': 1})
+        return {key: {'id': key, 'wins': 0} for key in keys}
+
+    assert sorted(cache.get_many_or_load([1, 2, 3], loader)) == [1, 2, 3]
+    assert requested == [[2, 3]]
+    assert cache.get(2) == {'id': 2, 'wins': 0}
+    assert cache.get(3) is None
+
+def test_flush_stores_committed_values(fake_db):
+    row_cache.get_user(1)
+    stats_buffer.record(1, wins=1)
+    fake_db.tables['users'][0]['wins'] = 5  # Committed meanwhile by another worker
+
+    assert stats_buffer.flush() == 1
+    assert row_cache.get_user(1)['wins'] == 6
+    assert 'image' not in row_cache.get_user(1)
@@ -0,0 +1,47 @@
+"""
+get_teams with several shards
+"""
+import sharding
+
+def test_get_teams_uses_cached_summaries_and_flags_missing_shards(client, fake_db, monkeypatch):
+    monkeypatch.setattr(sharding, 'NODES', {'a': 'http://a', 'b': 'http://b', 'c': 'http://c'})
+    monkeypatch.setattr(sharding, 'SHARD_ID', 'a')
+    monkeypatch.setattr(sharding, 'RING', sharding.HashRing(['a', 'b', 'c']))
+    monkeypatch.setattr(sharding, '_remote_summaries', {})
+
+    # Shard b answers, shard c is down
+    summaries = {'b': {'shard': 'b', 'teams': {'1': {'locations': 3, 'owner_count': 4}}}, 'c': None}
+    monkeypatch.setattr(sharding, '_fetch_summary', lambda node_id: summaries[node_id])
+    assert sharding.refresh_remote_summaries() == 1
+
+    def no_requests(node_id):
+        raise AssertionError('get_teams must not call other shards')
+    monkeypatch.setattr(sharding, '_fetch_summary', no_requests)
+
+    response = client.get('/api/teams/get_teams')
+    assert response.status_code == 200
+    assert response.json['partial'] is True
+    assert response.json['missing_shards'] == ['c']
+    assert {team['id']: team['locations_owned'] for team in response.json['data']}[1] == 3
+
+def test_forwarded_header_needs_the_shard_secret(client, fake_db, monkeypatch):
+    monkeypatch.setattr(sharding, 'NODES', {'a': 'http://a', 'b': 'http://b'})
+    monkeypatch.setattr(sharding, 'SHARD_ID', 'a')
+    monkeypatch.setattr(sharding, 'RING', sharding.HashRing(['a', 'b']))
+    monkeypatch.setattr(sharding, 'SHARD_SECRET', 'secret')
+    location_id = next(location_id for location_id in range(1, 100) if sharding.owner_of(location_id) == 'b')
+
+    forwarded = []
+    monkeypatch.setattr(sharding, 'forward', lambda node_id: forwarded.append(node_id) or ('', 204))
+
+    # A client setting the header itself is still routed to the owning node
+    response = client.get(f"/api/locations/{location_id}", headers={sharding.FORWARDED_HEADER: 'b'})
+    assert response.status_code == 204
+    response = client.get(f"/api/locations/{location_id}", headers={sharding.FORWARDED_HEADER: 'b', sharding.SECRET_HEADER: 'guess'})
+    assert response.status_code == 204
+    assert forwarded == ['b', 'b']
+
+    # A node presenting the secret is served here
+    response = client.get(f"/api/locations/{location_id}", headers={sharding.FORWARDED_HEADER: 'b', sharding.SECRET_HEADER: 'secret'})
+    assert response.status_code != 204
+    assert forwarded == ['b', 'b']
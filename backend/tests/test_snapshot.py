@@ -0,0 +1,30 @@
+"""
+Snapshot and history persistence
+"""
+import pytest
+import points_history
+import snapshot
+
+def test_failed_snapshot_write_stays_dirty(fake_db, tmp_path):
+    assert snapshot.reconcile()
+    blocker = tmp_path / 'not-a-directory'
+    blocker.write_text('')
+
+    with pytest.raises(OSError):
+        snapshot.write_snapshot(str(blocker / 'world.snapshot'))
+    assert snapshot._dirty
+
+    snapshot.write_snapshot(str(tmp_path / 'world.snapshot'))
+    assert not snapshot._dirty
+
+def test_failed_history_save_stays_dirty(tmp_path):
+    points_history.record(1, 10)
+    blocker = tmp_path / 'not-a-directory'
+    blocker.write_text('')
+
+    with pytest.raises(OSError):
+        points_history.save(str(blocker / 'points_history.bin'))
+    assert points_history._dirty
+
+    points_history.save(str(tmp_path / 'points_history.bin'))
+    assert not points_history._dirty
@@ -0,0 +1,41 @@
+"""
+Write-behind stat buffer shutdown
+"""
+import signal
+import pytest
+import stats_buffer
+
+def test_sigterm_flushes_before_the_previous_handler(monkeypatch):
+    calls = []
+    monkeypatch.setattr(stats_buffer, 'flush', lambda: calls.append('flush'))
+    handler = stats_buffer._handle_sigterm(lambda signum, frame: calls.append('previous'))
+
+    handler(signal.SIGTERM, None)
+    assert calls == ['flush', 'previous']
+
+def test_sigterm_without_previous_handler_exits(monkeypatch):
+    calls = []
+    monkeypatch.setattr(stats_buffer, 'flush', lambda: calls.append('flush'))
+    handler = stats_buffer._handle_sigterm(signal.SIG_DFL)
+
+    with pytest.raises(SystemExit):
+        handler(signal.SIGTERM, None)
+    assert calls == ['flush']
+
+def test_client_error_keeps_the_batch_pending(fake_db, monkeypatch):
+    def broken_client():
+        raise ValueError('Invalid URL')
+    monkeypatch.setattr(stats_buffer, 'get_supabase_client', broken_client)
+
+    stats_buffer.record(1, wins=1)
+    assert stats_buffer.flush() == 0
+    assert stats_buffer.pending_for(1)['wins'] == 1
+    assert not stats_buffer._in_flight
+
+def test_malformed_response_is_not_applied_twice(fake_db, monkeypatch):
+    monkeypatch.setattr(fake_db, '_rpc_apply_user_stat_deltas', lambda deltas: [{'wins': 1}])
+
+    stats_buffer.record(1, wins=1)
+    assert stats_buffer.flush() == 1
+    assert stats_buffer.pending_for(1)['wins'] == 0
+    assert not stats_buffer._in_flight